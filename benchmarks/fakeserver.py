@@ -0,0 +1,347 @@
+"""Simulated dLeyna media server for benchmarking Mopidy-dLeyna.
+
+This registers the ``com.intel.dleyna-server`` bus name on the given
+D-Bus connection and serves a synthetic music library consisting of
+artist, album and track objects, optionally delaying every reply to
+simulate slow media servers.
+
+"""
+
+import argparse
+import collections
+import logging
+import re
+
+import dbus
+import dbus.mainloop.glib
+import dbus.service
+from gi.repository import GLib
+
+BUS_NAME = "com.intel.dleyna-server"
+
+ROOT_PATH = "/com/intel/dLeynaServer"
+
+SERVER_PATH = ROOT_PATH + "/server/%d"
+
+MANAGER_IFACE = "com.intel.dLeynaServer.Manager"
+
+MEDIA_CONTAINER_IFACE = "org.gnome.UPnP.MediaContainer2"
+
+MEDIA_DEVICE_IFACE = "com.intel.dLeynaServer.MediaDevice"
+
+MEDIA_ITEM_IFACE = "org.gnome.UPnP.MediaItem2"
+
+MEDIA_OBJECT_IFACE = "org.gnome.UPnP.MediaObject2"
+
+# Type and TypeEx of objects per level, as reported by dLeyna
+TYPES = [
+    ("person.musicartist", "container.person.musicArtist", "Artist"),
+    ("album.music", "container.album.musicAlbum", "Album"),
+    ("music", None, "Track"),
+]
+
+WORDS = "red green blue black white silver golden blind happy lonely".split()
+
+logger = logging.getLogger(__name__)
+
+
+def generate(path, udn, fanout):
+    """Generate synthetic objects, keyed by relative object path."""
+    server = {
+        "Path": dbus.ObjectPath(path),
+        "Parent": dbus.ObjectPath(path),
+        "Type": "container",
+        "DisplayName": udn,
+        "ChildCount": dbus.UInt32(fanout[0]),
+        "Searchable": True,
+        "UDN": udn,
+        "FriendlyName": "Fake Media Server %s" % udn,
+        "SearchCaps": dbus.Array(
+            ["Path", "Type", "TypeEx", "DisplayName", "Artist", "Album", "Genre"],
+            signature="s",
+        ),
+        "SortCaps": dbus.Array(["DisplayName", "TrackNumber"], signature="s"),
+        "SystemUpdateID": dbus.UInt32(1),
+    }
+    objects = {"": server}
+
+    def children(parent, relpath, level, context):
+        for index in range(fanout[level]):
+            word = WORDS[(len(objects) + index) % len(WORDS)]
+            type, typeex, kind = TYPES[min(level, len(TYPES) - 1)]
+            childpath = "%s_%d" % (relpath or "o", index)
+            name = "%s %s %d" % (word.title(), kind, index + 1)
+            obj = {
+                "Path": dbus.ObjectPath(path + "/" + childpath),
+                "Parent": parent["Path"],
+                "Type": type,
+                "DisplayName": name,
+            }
+            if typeex:
+                obj["TypeEx"] = typeex
+            if level + 1 < len(fanout):
+                obj["ChildCount"] = dbus.UInt32(fanout[level + 1])
+                obj["Searchable"] = True
+                objects[childpath] = obj
+                children(obj, childpath, level + 1, dict(context, **{kind: name}))
+            else:
+                obj.update(
+                    {
+                        "Artist": context.get("Artist", ""),
+                        "Artists": dbus.Array(
+                            [context.get("Artist", "")], signature="s"
+                        ),
+                        "Album": context.get("Album", ""),
+                        "AlbumArtURL": "http://localhost/%s.jpg" % relpath,
+                        "Genre": word.title(),
+                        "Date": "2001-01-01",
+                        "Duration": dbus.Int32(180 + index),
+                        "TrackNumber": dbus.Int32(index + 1),
+                        "Bitrate": dbus.Int32(40000),
+                        "MIMEType": "audio/mpeg",
+                        "URLs": dbus.Array(
+                            ["http://localhost/%s.mp3" % childpath], signature="s"
+                        ),
+                    }
+                )
+                objects[childpath] = obj
+
+    children(server, "", 0, {})
+    return objects
+
+
+def sortkey(value):
+    if isinstance(value, int):
+        return "%010d" % value
+    else:
+        return str(value or "")
+
+
+class Query:
+    """Minimal parser and evaluator for UPnP search criteria."""
+
+    TOKENS = re.compile(r'\s*(\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+)')
+
+    def __init__(self, query):
+        self.tokens = [m.group(1) for m in self.TOKENS.finditer(query)]
+        self.pos = 0
+        self.expr = self.parse_or()
+
+    def __call__(self, obj):
+        return self.expr(obj)
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.peek() == "or":
+            self.next()
+            terms.append(self.parse_and())
+        return lambda obj: any(term(obj) for term in terms)
+
+    def parse_and(self):
+        factors = [self.parse_factor()]
+        while self.peek() == "and":
+            self.next()
+            factors.append(self.parse_factor())
+        return lambda obj: all(factor(obj) for factor in factors)
+
+    def parse_factor(self):
+        token = self.next()
+        if token == "(":
+            expr = self.parse_or()
+            self.next()  # ")"
+            return expr
+        elif token == "*":
+            return lambda obj: True
+        name, op = token, self.next()
+        value = self.next()
+        if value.startswith('"'):
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        return self.compare(name, op, value)
+
+    @staticmethod
+    def compare(name, op, value):
+        def values(obj):
+            v = obj.get(name)
+            if isinstance(v, list):
+                return [str(x).lower() for x in v]
+            return [] if v is None else [str(v).lower()]
+
+        value = value.lower()
+        if op == "=":
+            return lambda obj: value in values(obj)
+        elif op == "!=":
+            return lambda obj: value not in values(obj)
+        elif op == "contains":
+            return lambda obj: any(value in v for v in values(obj))
+        elif op == "doesNotContain":
+            return lambda obj: not any(value in v for v in values(obj))
+        elif op == "derivedfrom":
+            return lambda obj: any(v.startswith(value) for v in values(obj))
+        elif op == "exists":
+            return lambda obj: bool(values(obj)) == (value == "true")
+        else:
+            raise ValueError("Unsupported operator %s" % op)
+
+
+class MediaServer(dbus.service.FallbackObject):
+    def __init__(self, conn, path, objects, latency):
+        super().__init__(conn, path)
+        self.path = path
+        self.objects = objects
+        self.latency = latency
+        self.tree = collections.defaultdict(list)
+        for relpath, obj in objects.items():
+            if relpath:
+                self.tree[obj["Parent"]].append(obj)
+
+    def reply(self, reply, func, *args):
+        def callback():
+            try:
+                result = func(*args)
+                reply(*result) if isinstance(result, tuple) else reply(result)
+            except Exception as e:
+                logger.exception("Error handling request: %s", e)
+            return False
+
+        if self.latency:
+            GLib.timeout_add(self.latency, callback)
+        else:
+            callback()
+
+    def lookup(self, rel_path):
+        try:
+            return self.objects[rel_path.lstrip("/")]
+        except KeyError:
+            raise dbus.exceptions.DBusException(
+                "Object not found", name="com.intel.dLeyna.ObjectNotFound"
+            )
+
+    def children(self, rel_path):
+        return self.tree[self.lookup(rel_path)["Path"]]
+
+    def descendants(self, rel_path):
+        relpath = rel_path.lstrip("/")
+        prefix = relpath + "_" if relpath else ""
+        return [o for k, o in self.objects.items() if k and k.startswith(prefix)]
+
+    @staticmethod
+    def filtered(objs, filter, sort, offset, limit):
+        for key in reversed([k for k in sort.split(",") if k]):
+            reverse, field = key[0] == "-", key.lstrip("+-")
+            objs = sorted(objs, key=lambda o: sortkey(o.get(field)), reverse=reverse)
+        objs = objs[offset : offset + limit if limit else None]
+        if "*" in filter:
+            return [dbus.Dictionary(o, signature="sv") for o in objs]
+        return [
+            dbus.Dictionary({k: o[k] for k in filter if k in o}, signature="sv")
+            for o in objs
+        ]
+
+    @dbus.service.method(
+        dbus.PROPERTIES_IFACE,
+        in_signature="s",
+        out_signature="a{sv}",
+        rel_path_keyword="rel_path",
+        async_callbacks=("reply", "error"),
+    )
+    def GetAll(self, iface, rel_path=None, reply=None, error=None):  # noqa: N802
+        try:
+            obj = self.lookup(rel_path)
+        except Exception as e:
+            return error(e)
+        self.reply(reply, lambda: dbus.Dictionary(obj, signature="sv"))
+
+    @dbus.service.method(
+        MEDIA_CONTAINER_IFACE,
+        in_signature="uuass",
+        out_signature="aa{sv}",
+        rel_path_keyword="rel_path",
+        async_callbacks=("reply", "error"),
+    )
+    def ListChildrenEx(  # noqa: N802
+        self, offset, limit, filter, sort, rel_path=None, reply=None, error=None
+    ):
+        try:
+            objs = self.children(rel_path)
+        except Exception as e:
+            return error(e)
+        self.reply(reply, self.filtered, objs, filter, sort, offset, limit)
+
+    @dbus.service.method(
+        MEDIA_CONTAINER_IFACE,
+        in_signature="suuass",
+        out_signature="aa{sv}u",
+        rel_path_keyword="rel_path",
+        async_callbacks=("reply", "error"),
+    )
+    def SearchObjectsEx(  # noqa: N802
+        self, query, offset, limit, filter, sort, rel_path=None, reply=None, error=None
+    ):
+        try:
+            match = Query(query)
+            objs = [obj for obj in self.descendants(rel_path) if match(obj)]
+        except Exception as e:
+            return error(dbus.exceptions.DBusException(str(e)))
+
+        def search():
+            return self.filtered(objs, filter, sort, offset, limit), len(objs)
+
+        self.reply(reply, search)
+
+
+class Manager(dbus.service.Object):
+    def __init__(self, conn, servers):
+        super().__init__(conn, ROOT_PATH)
+        self.servers = servers
+
+    @dbus.service.method(MANAGER_IFACE, out_signature="ao")
+    def GetServers(self):  # noqa: N802
+        return [dbus.ObjectPath(server.path) for server in self.servers]
+
+    @dbus.service.method(MANAGER_IFACE)
+    def Rescan(self):  # noqa: N802
+        pass
+
+    @dbus.service.signal(MANAGER_IFACE, signature="o")
+    def FoundServer(self, path):  # noqa: N802
+        pass
+
+    @dbus.service.signal(MANAGER_IFACE, signature="o")
+    def LostServer(self, path):  # noqa: N802
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-a", "--address", required=True)
+    parser.add_argument("-f", "--fanout", default=[10, 10, 12], nargs="+", type=int)
+    parser.add_argument("-l", "--latency", default=0, type=int, help="milliseconds")
+    parser.add_argument("-s", "--servers", default=1, type=int)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARN)
+
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    conn = dbus.bus.BusConnection(args.address)
+    servers = []
+    for index in range(args.servers):
+        path, udn = SERVER_PATH % index, "uuid:fake-%d" % index
+        objects = generate(path, udn, args.fanout)
+        servers.append(MediaServer(conn, path, objects, args.latency))
+        logger.info("Serving %d objects from %s", len(objects), udn)
+    Manager(conn, servers)
+    dbus.service.BusName(BUS_NAME, conn)
+    GLib.MainLoop().run()
+
+
+if __name__ == "__main__":
+    main()
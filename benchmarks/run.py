@@ -0,0 +1,181 @@
+"""Benchmark Mopidy-dLeyna against a simulated dLeyna media server.
+
+This starts a private D-Bus daemon and a simulated media server (see
+``fakeserver.py``), and reports latency percentiles and throughput for
+browsing, searching, looking up, retrieving images and translating
+URIs.  No network or real UPnP devices are required, but ``dbus-daemon``
+and the D-Bus Python bindings have to be installed.
+
+Example::
+
+  python benchmarks/run.py --fanout 20 10 15 --latency 20 \\
+      --set upnp_pipeline_depth=4 --set cache_size=0
+
+"""
+
+import argparse
+import configparser
+import os
+import pathlib
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import types
+
+import dbus.mainloop.glib
+from gi.repository import GLib
+
+from mopidy_dleyna import Extension, cache
+from mopidy_dleyna.backend import DBUS_SESSION_BUS_RE, URLS_CACHE_SIZE
+from mopidy_dleyna.client import dLeynaClient
+from mopidy_dleyna.library import dLeynaLibraryProvider
+from mopidy_dleyna.playback import dLeynaPlaybackProvider
+
+FAKESERVER = pathlib.Path(__file__).parent / "fakeserver.py"
+
+WORDS = ["red", "blue", "happy", "lonely", "track 1"]
+
+
+def start_bus(command):
+    out = subprocess.check_output(command.split(), universal_newlines=True)
+    match = DBUS_SESSION_BUS_RE.search(out)
+    if not match:
+        raise ValueError(f"{command} returned invalid output: {out}")
+    return str(match.group(1)), int(match.group(2))
+
+
+def load_config(overrides):
+    parser = configparser.RawConfigParser()
+    parser.read_string(Extension().get_default_config())
+    values = dict(parser[Extension.ext_name])
+    values.update(overrides)
+    values["search_index"] = "false"
+    result, errors = Extension().get_config_schema().deserialize(values)
+    if errors:
+        raise ValueError(f"Invalid configuration: {errors}")
+    return {Extension.ext_name: result}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(p * len(values)), len(values) - 1)]
+
+
+def measure(name, func, args, count=len):
+    latencies = []
+    objects = 0
+    for arg in args:
+        start = time.perf_counter()
+        result = func(arg)
+        latencies.append(time.perf_counter() - start)
+        objects += count(result)
+    total = sum(latencies)
+    print(
+        "%-14s %6d %10.1f %10.1f %12.0f"
+        % (
+            name,
+            len(latencies),
+            percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000,
+            objects / total if total else 0,
+        )
+    )
+
+
+def wait_for_servers(client, count, timeout=10.0):
+    start = time.time()
+    while len(client.servers().get()) < count:
+        if time.time() > start + timeout:
+            raise RuntimeError("Timeout waiting for media servers")
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-f", "--fanout", default=["10", "10", "12"], nargs="+")
+    parser.add_argument("-l", "--latency", default="0", help="milliseconds")
+    parser.add_argument("-n", "--iterations", default=20, type=int)
+    parser.add_argument("-s", "--servers", default=1, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="override %s configuration value" % Extension.dist_name,
+    )
+    args = parser.parse_args()
+
+    config = load_config(item.split("=", 1) for item in args.set)
+    random.seed(args.seed)
+
+    address, pid = start_bus(config[Extension.ext_name]["dbus_start_session"])
+    server = subprocess.Popen(
+        [sys.executable, str(FAKESERVER), "--address", address]
+        + ["--fanout"]
+        + args.fanout
+        + ["--latency", args.latency, "--servers", str(args.servers)]
+    )
+    try:
+        dbus.mainloop.glib.threads_init()
+        mainloop = GLib.MainLoop()
+        threading.Thread(target=mainloop.run, daemon=True).start()
+        ext_config = config[Extension.ext_name]
+        client = dLeynaClient(
+            address,
+            mainloop=dbus.mainloop.glib.DBusGMainLoop(),
+            cache_size=ext_config["cache_size"],
+            cache_ttl=ext_config["cache_ttl"],
+        )
+        wait_for_servers(client, args.servers)
+
+        backend = types.SimpleNamespace(
+            client=client,
+            urls=cache.Cache(URLS_CACHE_SIZE, ext_config["cache_ttl"]),
+        )
+        library = dLeynaLibraryProvider(backend, config)
+        playback = dLeynaPlaybackProvider(None, backend)
+
+        servers = library.browse(library.root_directory.uri)
+        artists = [ref for s in servers for ref in library.browse(s.uri)]
+        albums = [ref for a in artists for ref in library.browse(a.uri)]
+        tracks = {album.uri: library.browse(album.uri) for album in albums}
+
+        def sample(population):
+            return [random.choice(population) for _ in range(args.iterations)]
+
+        print(
+            "%-14s %6s %10s %10s %12s"
+            % ("", "calls", "p50 [ms]", "p99 [ms]", "objects/s")
+        )
+        measure("browse", library.browse, sample([r.uri for r in servers + artists]))
+        measure(
+            "search",
+            lambda word: library.search({"any": [word]}),
+            sample(WORDS),
+            lambda result: len(result.tracks) + len(result.albums) if result else 0,
+        )
+        measure("lookup", library.lookup, sample([a.uri for a in albums]))
+        measure(
+            "get_images",
+            library.get_images,
+            [[t.uri for t in tracks[uri]] for uri in sample(list(tracks))],
+        )
+        measure(
+            "translate_uri",
+            playback.translate_uri,
+            sample([t.uri for refs in tracks.values() for t in refs]),
+            lambda url: 1 if url else 0,
+        )
+        mainloop.quit()
+    finally:
+        server.terminate()
+        server.wait()
+        os.kill(pid, signal.SIGTERM)
+
+
+if __name__ == "__main__":
+    main()
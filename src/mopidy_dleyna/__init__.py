@@ -19,13 +19,31 @@ class Extension(ext.Extension):
         schema["upnp_browse_limit"] = config.Integer(minimum=0)
         schema["upnp_lookup_limit"] = config.Integer(minimum=0)
         schema["upnp_search_limit"] = config.Integer(minimum=0)
+        schema["upnp_pipeline_depth"] = config.Integer(minimum=1)
+        schema["upnp_adaptive_limits"] = config.Boolean()
+        schema["translate_threshold"] = config.Integer(minimum=0)
+        schema["cache_size"] = config.Integer(minimum=0)
+        schema["cache_ttl"] = config.Integer(minimum=0)
+        schema["lookup_max_tracks"] = config.Integer(minimum=0)
+        schema["search_timeout"] = config.Float(minimum=0)
+        schema["search_first_page"] = config.Boolean()
+        schema["search_order"] = config.List(optional=True)
+        schema["search_max_results"] = config.Integer(minimum=0)
+        schema["search_index"] = config.Boolean()
+        schema["search_index_max_age"] = config.Integer(minimum=0)
+        schema["crawler_concurrency"] = config.Integer(minimum=1)
+        schema["crawler_rate_limit"] = config.Integer(minimum=0)
+        schema["metrics_file"] = config.Path(optional=True)
         schema["dbus_start_session"] = config.String()
+        schema["fast_start"] = config.Boolean()
         return schema
 
     def setup(self, registry):
         from .backend import dLeynaBackend
+        from .web import factory
 
         registry.add("backend", dLeynaBackend)
+        registry.add("http:app", {"name": self.ext_name, "factory": factory})
 
     def validate_environment(self):
         try:
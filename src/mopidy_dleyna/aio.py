@@ -0,0 +1,193 @@
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# number of worker threads for translating large pages
+TRANSLATE_WORKERS = 4
+
+_lock = threading.Lock()
+
+_loop = None
+
+_executor = None
+
+
+def loop():
+    """Return the shared event loop, running in a background thread."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="dLeynaEventLoop", daemon=True
+            ).start()
+        return _loop
+
+
+def executor():
+    """Return the shared thread pool for translating media objects."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                TRANSLATE_WORKERS, thread_name_prefix="dLeynaTranslate"
+            )
+        return _executor
+
+
+def translate_all(translate, objs):
+    """Translate media objects, skipping objects that cannot be translated."""
+    results = []
+    for obj in objs:
+        try:
+            results.append(translate(obj))
+        except ValueError as e:
+            logger.debug("Skipping %s: %s", obj.get("URI"), e)
+    return results
+
+
+def run(coro, timeout=None):
+    """Run a coroutine on the shared event loop and wait for its result."""
+    future = asyncio.run_coroutine_threadsafe(coro, loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+
+async def wait(future, timeout=None):
+    """Wait for the result of a :class:`mopidy_dleyna.util.Future`."""
+    loop = asyncio.get_running_loop()
+    result = loop.create_future()
+
+    def set_result(value, exc_info):
+        if exc_info is not None:
+            loop.call_soon_threadsafe(_set, result, None, exc_info[1] or exc_info[0])
+        else:
+            loop.call_soon_threadsafe(_set, result, value, None)
+
+    future.add_result_callback(set_result)
+    return await asyncio.wait_for(result, timeout)
+
+
+async def completed(value):
+    return value
+
+
+async def gather(*aws, timeout=None):
+    """Wait for multiple awaitables, returning results or exceptions."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(asyncio.TimeoutError())
+        elif task.cancelled():
+            results.append(asyncio.CancelledError())
+        else:
+            results.append(task.exception() or task.result())
+    return results
+
+
+async def collect(
+    func,
+    translate,
+    limit,
+    depth=1,
+    timeout=None,
+    pages=0,
+    maxcount=0,
+    threshold=0,
+    name=None,
+):
+    """Retrieve and translate all pages of a browse or search request.
+
+    If `timeout` expires, `pages` pages have been retrieved or
+    `maxcount` objects have been translated, return the results
+    retrieved so far.  Pages of at least
+    `threshold` objects are translated in the shared thread pool.
+    Results cut short by `timeout` are logged using `name`.
+
+    """
+    count = 0
+    offset = limit
+    pending = collections.deque([asyncio.ensure_future(func(0, limit))])
+    results = []
+    if timeout:
+        deadline = asyncio.get_running_loop().time() + timeout
+    try:
+        while pending:
+            try:
+                if timeout:
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    objs, more = await asyncio.wait_for(pending.popleft(), remaining)
+                else:
+                    objs, more = await pending.popleft()
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                if count:
+                    logger.warning(
+                        "Timeout retrieving %s, returning only %d objects",
+                        name or "results",
+                        len(results),
+                    )
+                    break
+                else:
+                    raise
+            except Exception:
+                # see library.iterate() for errors past the last object
+                if count:
+                    break
+                else:
+                    raise
+            objs = list(objs)
+            count += len(objs)
+            pages -= 1
+            if not (more and objs) or pages == 0:
+                _cancel(pending)
+            elif limit and len(objs) == limit:
+                while len(pending) < depth:
+                    pending.append(asyncio.ensure_future(func(offset, limit)))
+                    offset += limit
+            else:
+                _cancel(pending)
+                pending.append(asyncio.ensure_future(func(count, limit)))
+                offset = count + limit
+            if threshold and len(objs) >= threshold:
+                results.extend(
+                    await asyncio.get_running_loop().run_in_executor(
+                        executor(), translate_all, translate, objs
+                    )
+                )
+            else:
+                results.extend(translate_all(translate, objs))
+            # objects may be skipped, e.g. when matching queries locally
+            if 0 < maxcount <= len(results):
+                _cancel(pending)
+    finally:
+        _cancel(pending)
+    return results
+
+
+def _cancel(futures):
+    while futures:
+        futures.popleft().cancel()
+
+
+def _set(future, value, exception):
+    if future.done():
+        pass  # cancelled
+    elif exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(value)
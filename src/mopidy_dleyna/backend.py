@@ -1,4 +1,5 @@
 import errno
+import functools
 import logging
 import os
 import os.path
@@ -11,8 +12,8 @@ from mopidy import backend, exceptions
 
 import pykka
 
-from . import Extension
-from .client import dLeynaClient
+from . import Extension, cache, metrics
+from .client import LazyClient, dLeynaClient
 from .library import dLeynaLibraryProvider
 from .playback import dLeynaPlaybackProvider
 
@@ -24,6 +25,10 @@ DBUS_SESSION_BUS_RE = re.compile(
     re.MULTILINE | re.VERBOSE,
 )
 
+METRICS_INTERVAL = 15
+
+URLS_CACHE_SIZE = 10000
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,26 +38,57 @@ class dLeynaBackend(pykka.ThreadingActor, backend.Backend):
 
     __dbus_pid = None
 
+    __metrics_writer = None
+
     def __init__(self, config, audio):
         super().__init__()
-        try:
-            if self.__have_session_bus():
-                self.client = dLeynaClient()
-            else:
-                command = config[Extension.ext_name]["dbus_start_session"]
-                address, self.__dbus_pid = self.__start_session_bus(command)
-                self.client = dLeynaClient(address)
-        except Exception as e:
-            logger.error("Error starting %s: %s", Extension.dist_name, e)
-            # TODO: clean way to bail out late?
-            raise exceptions.ExtensionError("Error starting dLeyna client")
+        ext_config = config[Extension.ext_name]
+        servers_path = Extension.get_data_dir(config) / "servers.json"
+        if ext_config["fast_start"]:
+            # connect and discover media servers in the background
+            self.client = LazyClient(
+                functools.partial(self.__connect, ext_config, servers_path)
+            )
+        else:
+            try:
+                self.client = self.__connect(ext_config, servers_path)
+            except Exception as e:
+                logger.error("Error starting %s: %s", Extension.dist_name, e)
+                # TODO: clean way to bail out late?
+                raise exceptions.ExtensionError("Error starting dLeyna client")
+        # playback URLs of tracks, shared by library and playback
+        self.urls = cache.Cache(URLS_CACHE_SIZE, ext_config["cache_ttl"])
+        metrics.registry.register_cache("urls", self.urls)
         self.library = dLeynaLibraryProvider(self, config)
         self.playback = dLeynaPlaybackProvider(audio, self)
+        if ext_config["metrics_file"]:
+            self.__metrics_writer = metrics.Writer(
+                ext_config["metrics_file"], METRICS_INTERVAL
+            )
+
+    def on_start(self):
+        if self.__metrics_writer is not None:
+            self.__metrics_writer.start()
 
     def on_stop(self):
+        if self.__metrics_writer is not None:
+            self.__metrics_writer.stop()
         if self.__dbus_pid is not None:
             self.__stop_session_bus(self.__dbus_pid)
 
+    def __connect(self, ext_config, servers_path):
+        kwargs = {
+            "cache_size": ext_config["cache_size"],
+            "cache_ttl": ext_config["cache_ttl"],
+            "servers_path": servers_path,
+        }
+        if self.__have_session_bus():
+            return dLeynaClient(**kwargs)
+        else:
+            command = ext_config["dbus_start_session"]
+            address, self.__dbus_pid = self.__start_session_bus(command)
+            return dLeynaClient(address, **kwargs)
+
     def __have_session_bus(self):
         if "DBUS_SESSION_BUS_ADDRESS" in os.environ:
             return True
@@ -0,0 +1,90 @@
+import collections
+import threading
+import time
+
+
+class Cache:
+    """Thread-safe LRU cache with per-item time-to-live."""
+
+    def __init__(self, maxsize, ttl=None, getsizeof=None, timer=time.monotonic):
+        self.__data = collections.OrderedDict()
+        self.__lock = threading.RLock()
+        self.__maxsize = maxsize
+        self.__currsize = 0
+        self.__ttl = ttl
+        self.__getsizeof = getsizeof or (lambda value: 1)
+        self.__timer = timer
+        self.hits = self.misses = 0
+
+    def __contains__(self, key):
+        with self.__lock:
+            try:
+                self.__getitem(key)
+            except KeyError:
+                return False
+            else:
+                return True
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__data)
+
+    @property
+    def currsize(self):
+        with self.__lock:
+            return self.__currsize
+
+    @property
+    def maxsize(self):
+        return self.__maxsize
+
+    def get(self, key):
+        with self.__lock:
+            try:
+                value = self.__getitem(key)
+            except KeyError:
+                self.misses += 1
+                raise
+            else:
+                self.hits += 1
+                return value
+
+    def set(self, key, value, ttl=None):
+        size = self.__getsizeof(value)
+        if ttl is None:
+            ttl = self.__ttl
+        expires = self.__timer() + ttl if ttl else None
+        with self.__lock:
+            self.__delitem(key)
+            if size > self.__maxsize:
+                return  # too large to be cached
+            while self.__currsize + size > self.__maxsize:
+                self.__delitem(next(iter(self.__data)))
+            self.__data[key] = (value, size, expires)
+            self.__currsize += size
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+            self.__currsize = 0
+
+    def invalidate(self, predicate):
+        with self.__lock:
+            for key in [key for key in self.__data if predicate(key)]:
+                self.__delitem(key)
+
+    def __getitem(self, key):
+        value, _, expires = self.__data[key]
+        if expires is not None and expires <= self.__timer():
+            self.__delitem(key)
+            raise KeyError(key)
+        self.__data.move_to_end(key)
+        return value
+
+    def __delitem(self, key):
+        try:
+            _, size, _ = self.__data.pop(key)
+        except KeyError:
+            pass
+        else:
+            self.__currsize -= size
@@ -1,4 +1,6 @@
+import json
 import logging
+import os
 import threading
 import time
 from collections.abc import Mapping
@@ -7,7 +9,7 @@ import dbus
 
 import uritools
 
-from . import Extension, util
+from . import Extension, cache, metrics, util
 
 SERVER_BUS_NAME = "com.intel.dleyna-server"
 
@@ -15,6 +17,9 @@ SERVER_ROOT_PATH = "/com/intel/dLeynaServer"
 
 SERVER_MANAGER_IFACE = "com.intel.dLeynaServer.Manager"
 
+# media server properties to keep for warm restarts
+SERVER_PROPERTIES = ["FriendlyName", "Path", "SearchCaps", "SortCaps", "UDN"]
+
 logger = logging.getLogger(__name__)
 
 
@@ -42,11 +47,32 @@ def urimapper(baseuri, prefix="/com/intel/dLeynaServer/server/"):
     return mapper
 
 
+def sizeof(value):
+    if isinstance(value, dict):
+        return 1  # GetAll
+    elif isinstance(value, tuple):
+        return max(len(value[0]), 1)  # SearchObjectsEx
+    else:
+        return max(len(value), 1)  # ListChildrenEx
+
+
+def _provisional(obj):
+    return obj.get("Provisional", False)
+
+
 class Servers(Mapping):
-    def __init__(self, bus):
+    def __init__(self, bus, path=None):
         self.__bus = bus
         self.__lock = threading.RLock()
         self.__servers = {}
+        self.__listeners = []
+        # pending requests of initial server discovery
+        self.__discovering = {SERVER_ROOT_PATH}
+        self.__discovered_event = threading.Event()
+        # servers from last run, until confirmed by discovery
+        self.__path = path
+        if path is not None:
+            self.__load(path)
 
         bus.add_signal_receiver(
             self.__found_server, "FoundServer", bus_name=SERVER_BUS_NAME
@@ -69,33 +95,120 @@ class Servers(Mapping):
         with self.__lock:
             return len(self.__servers)
 
+    @property
+    def discovering(self):
+        with self.__lock:
+            return bool(self.__discovering)
+
+    def add_listener(self, listener):
+        with self.__lock:
+            self.__listeners.append(listener)
+            servers = [obj for obj in self.__servers.values() if not _provisional(obj)]
+        for obj in servers:
+            listener("found", obj)
+
+    def wait(self, timeout=None):
+        return self.__discovered_event.wait(timeout)
+
     def __add_server(self, obj):
         udn = obj["UDN"]
         obj["URI"] = uritools.uricompose(Extension.ext_name, udn)
         obj["DisplayName"] = obj.get("DisplayName", obj["URI"])
         key = udn.lower()
-        if key not in self:
-            self.__log_server_action("Found", obj)
         with self.__lock:
+            found = key not in self.__servers or _provisional(self.__servers[key])
             self.__servers[key] = obj
+        if found:
+            self.__log_server_action("Found", obj)
+            self.__notify("found", obj)
+            self.__save()
 
     def __remove_server(self, obj):
         key = obj["UDN"].lower()
         with self.__lock:
             del self.__servers[key]
         self.__log_server_action("Lost", obj)
+        if not _provisional(obj):
+            self.__notify("lost", obj)
+        self.__save()
+
+    def __notify(self, action, obj):
+        with self.__lock:
+            listeners = list(self.__listeners)
+        for listener in listeners:
+            try:
+                listener(action, obj)
+            except Exception as e:
+                logger.error("Error notifying %s server listener: %s", action, e)
 
     def __found_server(self, path):
+        def reply_handler(obj):
+            try:
+                self.__add_server(obj)
+            finally:
+                self.__discovered(path)
+
         def error_handler(e):
             logger.warning("Cannot access media server %s: %s", path, e)
+            self.__discovered(path)
 
         self.__bus.get_object(SERVER_BUS_NAME, path).GetAll(
             "",  # all interfaces
             dbus_interface=dbus.PROPERTIES_IFACE,
-            reply_handler=self.__add_server,
+            reply_handler=reply_handler,
             error_handler=error_handler,
         )
 
+    def __discovered(self, path):
+        with self.__lock:
+            if not self.__discovering:
+                return
+            self.__discovering.discard(path)
+            if self.__discovering:
+                return
+            # drop servers from last run that were not found again
+            servers = [obj for obj in self.__servers.values() if _provisional(obj)]
+        for obj in servers:
+            self.__remove_server(obj)
+        self.__discovered_event.set()
+        self.__save()
+
+    def __load(self, path):
+        try:
+            with path.open() as f:
+                servers = {}
+                for obj in json.load(f):
+                    if not isinstance(obj["Path"], str):
+                        raise TypeError("Invalid media server path")
+                    obj["URI"] = uritools.uricompose(Extension.ext_name, obj["UDN"])
+                    obj["DisplayName"] = obj["URI"]
+                    obj["Provisional"] = True
+                    servers[obj["UDN"].lower()] = obj
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("Error loading media servers from %s: %s", path, e)
+            return
+        self.__servers.update(servers)
+
+    def __save(self):
+        if self.__path is None:
+            return
+        with self.__lock:
+            if self.__discovering:
+                return  # keep servers from last run until discovered
+            servers = [
+                {name: obj[name] for name in SERVER_PROPERTIES if name in obj}
+                for obj in self.__servers.values()
+            ]
+        try:
+            tmp = self.__path.with_suffix(".tmp")
+            with tmp.open("w") as f:
+                json.dump(servers, f)
+            os.replace(tmp, self.__path)
+        except Exception as e:
+            logger.warning("Error saving media servers to %s: %s", self.__path, e)
+
     def __lost_server(self, path):
         with self.__lock:
             servers = list(self.__servers.values())
@@ -106,11 +219,15 @@ class Servers(Mapping):
 
     def __get_servers(self):
         def reply_handler(paths):
+            with self.__lock:
+                self.__discovering.update(paths)
+            self.__discovered(SERVER_ROOT_PATH)
             for path in paths:
                 self.__found_server(path)
 
         def error_handler(e):
             logger.error("Cannot retrieve digital media servers: %s", e)
+            self.__discovered(SERVER_ROOT_PATH)
 
         self.__bus.get_object(SERVER_BUS_NAME, SERVER_ROOT_PATH).GetServers(
             dbus_interface=SERVER_MANAGER_IFACE,
@@ -138,34 +255,91 @@ class dLeynaClient:
 
     MEDIA_OBJECT_IFACE = "org.gnome.UPnP.MediaObject2"
 
-    def __init__(self, address=None, mainloop=None):
+    CACHED_METHODS = frozenset(["GetAll", "ListChildrenEx", "SearchObjectsEx"])
+
+    # number of media objects in replies, for metrics
+    REPLY_OBJECTS = {
+        "GetAll": lambda value: 1,
+        "GetCompatibleResource": lambda value: 1,
+        "ListChildrenEx": len,
+        "SearchObjectsEx": lambda value: len(value[0]),
+    }
+
+    # seconds to wait for discovery of media servers from last run
+    DISCOVERY_TIMEOUT = 10
+
+    def __init__(
+        self,
+        address=None,
+        mainloop=None,
+        cache_size=0,
+        cache_ttl=0,
+        servers_path=None,
+    ):
         if address:
             self.__bus = dbus.bus.BusConnection(address, mainloop=mainloop)
         else:
             self.__bus = dbus.SessionBus(mainloop=mainloop)
-        self.__servers = Servers(self.__bus)
+        if cache_size:
+            self.__cache = cache.Cache(cache_size, cache_ttl, getsizeof=sizeof)
+            metrics.registry.register_cache("objects", self.__cache)
+        else:
+            self.__cache = None
+        # in-flight calls, shared by concurrent identical requests
+        self.__pending = {}
+        self.__lock = threading.RLock()
+        # incremented on invalidation, so stale replies are not cached
+        self.__generation = 0
+        self.__started = time.monotonic()
+        self.__servers = Servers(self.__bus, servers_path)
+        self.__servers.add_listener(self.__server_changed)
+        # servers known to send ContainerUpdateIDs notifications
+        self.__container_updates = set()
+
+        self.__bus.add_signal_receiver(
+            self.__container_update_ids,
+            "ContainerUpdateIDs",
+            dbus_interface=self.MEDIA_DEVICE_IFACE,
+            bus_name=SERVER_BUS_NAME,
+            path_keyword="path",
+        )
+        self.__bus.add_signal_receiver(
+            self.__properties_changed,
+            "PropertiesChanged",
+            dbus_interface=dbus.PROPERTIES_IFACE,
+            bus_name=SERVER_BUS_NAME,
+            path_keyword="path",
+        )
 
-    def browse(self, uri, offset=0, limit=0, filter=None, order=None):
+    def add_server_listener(self, listener):
+        self.__servers.add_listener(listener)
+
+    def discovering(self):
+        return self.__servers.discovering
+
+    def browse(self, uri, offset=0, limit=0, filter=None, order=None, cached=True):
         if filter is None:
             filter = ["*"]
         if order is None:
             order = []
 
         baseuri, objpath = self.__parseuri(uri)
-        future = util.Future.fromdbus(
-            self.__bus.get_object(SERVER_BUS_NAME, objpath).ListChildrenEx,
+        future = self.__call(
+            objpath,
+            "ListChildrenEx",
             dbus.UInt32(offset),
             dbus.UInt32(limit),
             urifilter(filter),
             ",".join(self.__sortorder(uri, order)),
             dbus_interface=self.MEDIA_CONTAINER_IFACE,
+            cached=cached,
         )
 
         def mapper(res):
             if baseuri and (filter == ["*"] or "URI" in filter):
-                objs = map(urimapper(baseuri), res)
+                objs = list(map(urimapper(baseuri), res))
             else:
-                objs = res
+                objs = list(res)
             # dleyna does not pass TotalMatches from Browse action;
             # also note that a server may choose to return less than
             # `limit` items, so assume `more` until nothing found
@@ -176,8 +350,9 @@ class dLeynaClient:
 
     def properties(self, uri, iface=None):
         baseuri, objpath = self.__parseuri(uri)
-        future = util.Future.fromdbus(
-            self.__bus.get_object(SERVER_BUS_NAME, objpath).GetAll,
+        future = self.__call(
+            objpath,
+            "GetAll",
             iface or "",
             dbus_interface=dbus.PROPERTIES_IFACE,
         )
@@ -186,7 +361,22 @@ class dLeynaClient:
         else:
             return future
 
+    def resource(self, uri, protocol_info, filter=None):
+        baseuri, objpath = self.__parseuri(uri)
+        return self.__call(
+            objpath,
+            "GetCompatibleResource",
+            protocol_info,
+            urifilter(filter or ["*"]),
+            dbus_interface=self.MEDIA_ITEM_IFACE,
+        )
+
     def rescan(self):
+        with self.__lock:
+            self.__generation += 1
+            self.__pending.clear()
+        if self.__cache is not None:
+            self.__cache.clear()
         return util.Future.fromdbus(
             self.__bus.get_object(SERVER_BUS_NAME, SERVER_ROOT_PATH).Rescan,
             dbus_interface=SERVER_MANAGER_IFACE,
@@ -199,8 +389,9 @@ class dLeynaClient:
             order = []
 
         baseuri, objpath = self.__parseuri(uri)
-        future = util.Future.fromdbus(
-            self.__bus.get_object(SERVER_BUS_NAME, objpath).SearchObjectsEx,
+        future = self.__call(
+            objpath,
+            "SearchObjectsEx",
             query,
             dbus.UInt32(offset),
             dbus.UInt32(limit),
@@ -212,9 +403,9 @@ class dLeynaClient:
         def mapper(res):
             items, total = res
             if baseuri and (filter == ["*"] or "URI" in filter):
-                objs = map(urimapper(baseuri), items)
+                objs = list(map(urimapper(baseuri), items))
             else:
-                objs = items
+                objs = list(items)
             more = offset + len(items) < total
             return objs, more
 
@@ -228,6 +419,73 @@ class dLeynaClient:
         # return future for consistency/future extensions
         return util.Future.fromvalue(self.__servers.values())
 
+    def __call(self, objpath, method, *args, cached=True, **kwargs):
+        func = getattr(self.__bus.get_object(SERVER_BUS_NAME, objpath), method)
+        if not cached or method not in self.CACHED_METHODS:
+            return self.__fromdbus(objpath, method, func, args, kwargs)
+        key = (objpath, method) + tuple(
+            tuple(arg) if isinstance(arg, list) else arg for arg in args
+        )
+        if self.__cache is not None:
+            try:
+                return util.Future.fromvalue(self.__cache.get(key))
+            except KeyError:
+                logger.debug("Cache miss for %s%s", method, args)
+        with self.__lock:
+            try:
+                future = self.__pending[key]
+            except KeyError:
+                pass
+            else:
+                logger.debug("Joining pending call %s%s", method, args)
+                return future
+            future = self.__pending[key] = self.__request(key, func, args, kwargs)
+
+        def done(_):
+            with self.__lock:
+                if self.__pending.get(key) is future:
+                    del self.__pending[key]
+
+        future.add_done_callback(done)
+        return future
+
+    def __request(self, key, func, args, kwargs):
+        with self.__lock:
+            generation = self.__generation
+        future = self.__fromdbus(key[0], key[1], func, args, kwargs)
+        if self.__cache is None:
+            return future
+        # objects of servers publishing a SystemUpdateID are cached
+        # until invalidated by change notifications
+        server = self.__server_for_path(key[0])
+        ttl = 0 if server and "SystemUpdateID" in server else None
+
+        def store(value):
+            with self.__lock:
+                # skip replies that may predate an invalidation
+                if generation == self.__generation:
+                    self.__cache.set(key, value, ttl)
+            return value
+
+        return future.map(store)
+
+    def __fromdbus(self, objpath, method, func, args, kwargs):
+        server = self.__server_for_path(objpath)
+        udn = server["UDN"] if server else None
+        start = time.monotonic()
+        future = util.Future.fromdbus(func, *args, **kwargs)
+
+        def observe(value, exc_info):
+            latency = time.monotonic() - start
+            if exc_info is not None:
+                metrics.registry.observe(method, udn, latency, error=True)
+            else:
+                objects = self.REPLY_OBJECTS.get(method, lambda value: 0)(value)
+                metrics.registry.observe(method, udn, latency, objects)
+
+        future.add_result_callback(observe)
+        return future
+
     def __parseuri(self, uri):
         try:
             server = self.__server(uri)
@@ -248,21 +506,148 @@ class dLeynaClient:
         else:
             return list(filter(lambda f: f[1:] in sortcaps, order))
 
+    def __container_update_ids(self, updates, path=None):
+        self.__container_updates.add(path)
+        containers = frozenset(objpath for objpath, _ in updates)
+        logger.debug("Containers updated on %s: %s", path, sorted(containers))
+        prefix = path + "/"
+        # object paths do not reflect the container hierarchy, so any
+        # search result or object property from this server may be
+        # affected
+        self.__invalidate(
+            lambda key: key[0] in containers
+            or key[1] in ("GetAll", "SearchObjectsEx")
+            and (key[0] == path or key[0].startswith(prefix))
+        )
+
+    def __properties_changed(self, iface, changed, invalidated, path=None):
+        if iface != self.MEDIA_DEVICE_IFACE or "SystemUpdateID" not in changed:
+            return
+        logger.debug("SystemUpdateID changed on %s", path)
+        # only invalidate everything if we cannot rely on receiving
+        # ContainerUpdateIDs for the affected containers
+        if path not in self.__container_updates:
+            self.__invalidate_server(path)
+
+    def __server_changed(self, action, obj):
+        if action == "lost":
+            self.__container_updates.discard(obj["Path"])
+            self.__invalidate_server(obj["Path"])
+
+    def __invalidate(self, predicate):
+        # also stop sharing pending calls that may return stale objects
+        with self.__lock:
+            self.__generation += 1
+            for key in [key for key in self.__pending if predicate(key)]:
+                del self.__pending[key]
+        if self.__cache is not None:
+            self.__cache.invalidate(predicate)
+
+    def __invalidate_server(self, path):
+        prefix = path + "/"
+        self.__invalidate(lambda key: key[0] == path or key[0].startswith(prefix))
+
+    def __server_for_path(self, objpath):
+        for server in self.__servers.values():
+            path = server["Path"]
+            if _provisional(server):
+                continue  # object paths may have changed
+            elif objpath == path or objpath.startswith(path + "/"):
+                return server
+        return None
+
     def __server(self, uri):
         udn = uritools.urisplit(uri).gethost()
         if not udn:
             raise ValueError("Invalid URI %s" % uri)
         try:
             server = self.__servers[udn]
+            if _provisional(server):
+                # object paths may have changed since last run; wait
+                # for discovery once, not for each provisional server
+                timeout = self.__started + self.DISCOVERY_TIMEOUT - time.monotonic()
+                self.__servers.wait(max(timeout, 0))
+                server = self.__servers[udn]
         except KeyError:
             raise LookupError("Unknown media server UDN %s" % udn)
         else:
+            if _provisional(server):
+                raise LookupError("Media server %s not available" % udn)
             return server
 
 
+class LazyClient:
+    """dLeyna client connecting to D-Bus in a background thread.
+
+    Until the client returned by `factory` is available, no media
+    servers are reported, and other calls wait for up to `timeout`
+    seconds for the connection to be established.
+
+    """
+
+    MEDIA_CONTAINER_IFACE = dLeynaClient.MEDIA_CONTAINER_IFACE
+
+    MEDIA_DEVICE_IFACE = dLeynaClient.MEDIA_DEVICE_IFACE
+
+    MEDIA_ITEM_IFACE = dLeynaClient.MEDIA_ITEM_IFACE
+
+    MEDIA_OBJECT_IFACE = dLeynaClient.MEDIA_OBJECT_IFACE
+
+    def __init__(self, factory, timeout=10):
+        self.__client = None
+        self.__error = None
+        self.__lock = threading.Lock()
+        self.__listeners = []
+        self.__ready = threading.Event()
+        self.__timeout = timeout
+        threading.Thread(
+            target=self.__connect, args=(factory,), name="dLeynaConnect", daemon=True
+        ).start()
+
+    def __getattr__(self, name):
+        if not self.__ready.wait(self.__timeout):
+            raise RuntimeError("Timeout connecting to dLeyna")
+        elif self.__client is None:
+            raise RuntimeError("Error connecting to dLeyna: %s" % self.__error)
+        else:
+            return getattr(self.__client, name)
+
+    def add_server_listener(self, listener):
+        with self.__lock:
+            if self.__client is None:
+                return self.__listeners.append(listener)
+        self.__client.add_server_listener(listener)
+
+    def discovering(self):
+        if self.__ready.is_set():
+            return self.__client is not None and self.__client.discovering()
+        else:
+            return True
+
+    def servers(self):
+        if self.__client is None:
+            return util.Future.fromvalue([])
+        else:
+            return self.__client.servers()
+
+    def __connect(self, factory):
+        try:
+            client = factory()
+        except Exception as e:
+            logger.error("Error starting dLeyna client: %s", e)
+            self.__error = e
+        else:
+            with self.__lock:
+                self.__client = client
+                listeners, self.__listeners = self.__listeners, []
+            for listener in listeners:
+                client.add_server_listener(listener)
+        finally:
+            self.__ready.set()
+
+
 if __name__ == "__main__":  # pragma: no cover
     import argparse
-    import json
     import sys
 
     import dbus.mainloop.glib
@@ -0,0 +1,179 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+
+class Progress:
+    def __init__(self, containers=0, objects=0, errors=0, pending=0):
+        self.containers = containers
+        self.objects = objects
+        self.errors = errors
+        self.pending = pending
+        self.state = "idle"
+
+    def __repr__(self):
+        return "%s(state=%r, containers=%d, objects=%d, errors=%d)" % (
+            self.__class__.__name__,
+            self.state,
+            self.containers,
+            self.objects,
+            self.errors,
+        )
+
+
+class Crawler:
+    """Breadth-first media server crawler with resumable checkpoints.
+
+    Objects retrieved from a media server are passed to `sink`, which
+    must provide `begin(udn)`, `add(udn, objs)` and `commit(udn)`
+    methods for starting, extending and completing a server's crawl.
+
+    """
+
+    def __init__(self, client, sink, path, filter, limit, concurrency=1, rate=0):
+        self.__client = client
+        self.__sink = sink
+        self.__path = path
+        self.__filter = filter
+        self.__limit = limit
+        self.__concurrency = concurrency
+        self.__interval = 1.0 / rate if rate else 0
+        self.__lock = threading.Lock()
+        self.__threads = {}
+        self.__stopped = {}
+        self.__progress = {}
+
+    def progress(self):
+        with self.__lock:
+            return dict(self.__progress)
+
+    def start(self, server):
+        key = server["UDN"].lower()
+        with self.__lock:
+            previous = self.__threads.get(key)
+            if previous and previous.is_alive() and not self.__stopped[key].is_set():
+                return
+            stopped = self.__stopped[key] = threading.Event()
+            thread = self.__threads[key] = threading.Thread(
+                target=self.__run,
+                args=(server, stopped, previous),
+                name="Crawler-%s" % server["UDN"],
+                daemon=True,
+            )
+        thread.start()
+
+    def stop(self, udn=None):
+        with self.__lock:
+            if udn is None:
+                events = list(self.__stopped.values())
+            else:
+                events = [self.__stopped.get(udn.lower(), threading.Event())]
+        for event in events:
+            event.set()
+
+    def __run(self, server, stopped, previous=None):
+        name, udn = server["FriendlyName"], server["UDN"]
+        if previous is not None:
+            # a stopped crawl may still be waiting for replies
+            previous.join()
+        checkpoint = self.__checkpoint(udn)
+        try:
+            queue, progress = self.__load(checkpoint)
+        except FileNotFoundError:
+            queue, progress = collections.deque([(server["URI"], 0)]), Progress()
+            self.__sink.begin(udn)
+            logger.info("Crawling %s", name)
+        except Exception as e:
+            logger.warning("Cannot resume crawling %s: %s", name, e)
+            queue, progress = collections.deque([(server["URI"], 0)]), Progress()
+            self.__sink.begin(udn)
+        else:
+            logger.info("Resuming crawling %s at %d objects", name, progress.objects)
+        progress.state = "running"
+        with self.__lock:
+            self.__progress[udn.lower()] = progress
+        try:
+            while queue and not stopped.is_set():
+                self.__crawl(server, queue, progress)
+                progress.pending = len(queue)
+                self.__save(checkpoint, queue, progress)
+        except Exception as e:
+            logger.warning("Error crawling %s: %s", name, e)
+            progress.state = "failed"
+        else:
+            if queue:
+                logger.info("Stopped crawling %s: %r", name, progress)
+                progress.state = "stopped"
+            else:
+                self.__sink.commit(udn)
+                self.__remove(checkpoint)
+                logger.info("Finished crawling %s: %r", name, progress)
+                progress.state = "complete"
+
+    def __crawl(self, server, queue, progress):
+        futures = []
+        while queue and len(futures) < self.__concurrency:
+            uri, offset = queue.popleft()
+            time.sleep(self.__interval)
+            # bypass client cache, which would be flushed by crawling
+            future = self.__client.browse(
+                uri, offset, self.__limit, self.__filter, cached=False
+            )
+            futures.append((uri, offset, future))
+        for uri, offset, future in futures:
+            try:
+                objs, more = future.get()
+            except Exception as e:
+                # may happen when browsing beyond the last object
+                if not offset:
+                    logger.debug("Error crawling %s: %s", uri, e)
+                    progress.errors += 1
+                continue
+            objs = list(objs)
+            if not offset:
+                progress.containers += 1
+            if more and objs:
+                queue.append((uri, offset + len(objs)))
+            for obj in objs:
+                # dLeyna reports e.g. "album.music" as Type of albums
+                if obj.get("TypeEx", obj.get("Type", "")).startswith("container"):
+                    queue.append((obj["URI"], 0))
+            if objs:
+                progress.objects += len(objs)
+                self.__sink.add(server["UDN"], objs)
+
+    def __checkpoint(self, udn):
+        return self.__path / (urllib.parse.quote(udn.lower(), safe="") + ".json")
+
+    def __load(self, path):
+        with path.open() as f:
+            data = json.load(f)
+        queue = collections.deque(tuple(item) for item in data["queue"])
+        return queue, Progress(**data["progress"])
+
+    def __save(self, path, queue, progress):
+        data = {
+            "queue": list(queue),
+            "progress": {
+                "containers": progress.containers,
+                "objects": progress.objects,
+                "errors": progress.errors,
+                "pending": progress.pending,
+            },
+        }
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def __remove(self, path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
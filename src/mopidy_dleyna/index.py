@@ -0,0 +1,118 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from . import translator
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS servers (
+    udn TEXT PRIMARY KEY,
+    updated REAL NOT NULL,
+    complete INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS objects USING fts5(
+    udn UNINDEXED,
+    type UNINDEXED,
+    data UNINDEXED,
+    DisplayName,
+    Album,
+    Artist,
+    Genre,
+    Date,
+    TrackNumber
+);
+"""
+
+_COLUMNS = translator.QUERY_FIELDS
+
+_values = translator.values_of
+
+
+def _match(query):
+    terms = []
+    for key, values in query.items():
+        try:
+            columns = " ".join(_COLUMNS[key])
+        except KeyError:
+            raise NotImplementedError('Keyword "%s" not supported' % key)
+        for value in values:
+            phrase = str(value).replace('"', '""')
+            terms.append('{%s} : "%s" *' % (columns, phrase))
+    return " AND ".join(terms)
+
+
+class LibraryIndex:
+    """Persistent full-text index of media server objects."""
+
+    def __init__(self, path, max_age=0):
+        self.__conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.__conn.executescript(SCHEMA)
+        self.__lock = threading.RLock()
+        self.__max_age = max_age
+
+    def add(self, udn, objs):
+        rows = []
+        for obj in objs:
+            try:
+                type = translator.ref(obj).type
+                translator.model(obj)
+            except (KeyError, ValueError) as e:
+                logger.debug("Not indexing %s: %s", obj.get("URI"), e)
+            else:
+                rows.append(
+                    [udn.lower(), type, json.dumps(obj)]
+                    + [" ".join(_values(obj, name)) for name in _COLUMNS["any"]]
+                    + [" ".join(_values(obj, "Date"))]
+                    + [" ".join(_values(obj, "TrackNumber"))]
+                )
+        with self.__lock, self.__conn:
+            self.__conn.executemany(
+                "INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def begin(self, udn):
+        with self.__lock, self.__conn:
+            self.__conn.execute("DELETE FROM objects WHERE udn = ?", [udn.lower()])
+            self.__update(udn, False)
+
+    def commit(self, udn):
+        with self.__lock, self.__conn:
+            self.__update(udn, True)
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
+
+    def fresh(self, udn):
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT updated, complete FROM servers WHERE udn = ?", [udn.lower()]
+            ).fetchone()
+        if not row or not row[1]:
+            return False
+        elif self.__max_age:
+            return time.time() < row[0] + self.__max_age
+        else:
+            return True
+
+    def search(self, udn, query, exact=False):
+        if not query:
+            sql, args = "SELECT type, data FROM objects WHERE udn = ?", [udn.lower()]
+        else:
+            sql = "SELECT type, data FROM objects WHERE udn = ? AND objects MATCH ?"
+            args = [udn.lower(), _match(query)]
+        with self.__lock:
+            rows = self.__conn.execute(sql, args).fetchall()
+        objs = (json.loads(data) for _, data in rows)
+        # full-text search is token based, so check actual values
+        return [obj for obj in objs if translator.match(obj, query or {}, exact)]
+
+    def __update(self, udn, complete):
+        self.__conn.execute(
+            "INSERT OR REPLACE INTO servers VALUES (?, ?, ?)",
+            [udn.lower(), time.time(), int(complete)],
+        )
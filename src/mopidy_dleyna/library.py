@@ -1,13 +1,20 @@
+import asyncio
+import base64
 import collections
+import functools
+import heapq
 import itertools
+import json
 import logging
 import operator
+import sqlite3
+import time
 
 from mopidy import backend, models
 
 import uritools
 
-from . import Extension, translator
+from . import Extension, aio, cache, crawler, index, metrics, profile, translator
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +36,7 @@ LOOKUP_FILTER = SEARCH_FILTER = [
     "Type",
     "TypeEx",
     "URI",
+    "URLs",
 ]
 
 BROWSE_ORDER = {
@@ -37,15 +45,128 @@ BROWSE_ORDER = {
     models.Ref.DIRECTORY: ["+TypeEx", "+DisplayName"],
 }
 
-LOOKUP_QUERY = 'Type = "music" or Type = "audio"'  # TODO: check SearchCaps
+LOOKUP_QUERY = 'Type = "music" or Type = "audio"'
 
+IMAGES_CACHE_SIZE = 10000
 
-def iterate(func, translate, limit):
+# minimum number of concurrent Path searches per media server
+PATHSEARCH_CONCURRENCY = 4
+
+# minimum share of a container's children to browse for their images
+SIBLINGS_SHARE = 0.5
+
+PARENTS_CACHE_SIZE = 10000
+
+
+def encode_cursor(query, exact, offsets):
+    """Encode search state as an opaque cursor."""
+    state = {"query": query or {}, "exact": exact, "offsets": offsets}
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a search cursor, raising ValueError if it is invalid."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        query, exact, offsets = state["query"], state["exact"], state["offsets"]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ValueError("Invalid search cursor")
+    if not (
+        isinstance(query, dict)
+        and isinstance(exact, bool)
+        and isinstance(offsets, dict)
+        and all(type(offset) is int and offset >= 0 for offset in offsets.values())
+    ):
+        raise ValueError("Invalid search cursor")
+    return query, exact, offsets
+
+
+class _Reversed:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _sortvalue(value):
+    # missing values last, numbers before strings
+    if value is None:
+        return (2, "")
+    elif isinstance(value, (int, float)):
+        return (0, value)
+    else:
+        return (1, str(value).casefold())
+
+
+def sortkey(order):
+    """Return a key function for sorting objects by UPnP sort order."""
+    fields = [(key[1:], key.startswith("-")) for key in order]
+
+    def key(obj):
+        return tuple(
+            (
+                _Reversed(_sortvalue(obj.get(name)))
+                if reverse
+                else _sortvalue(obj.get(name))
+            )
+            for name, reverse in fields
+        )
+
+    return key
+
+
+def dispatch(calls, depth):
+    # start the first `depth` calls right away, so calls dispatched
+    # for multiple media servers are processed concurrently
+    futures = (call() for call in calls)
+    pending = collections.deque(itertools.islice(futures, depth))
+
+    def results():
+        while pending:
+            future = pending.popleft()
+            try:
+                yield future.get()
+            except Exception as e:
+                logger.warning("Error retrieving results: %s", e)
+            pending.extend(itertools.islice(futures, 1))
+
+    return results()
+
+
+class _Results:
+    # future-like wrapper for dispatching iterate() results
+    def __init__(self, iterable):
+        self.__iterable = iterable
+
+    def get(self):
+        return list(self.__iterable)
+
+
+def iterate(func, translate, limit, depth=1, threshold=0):
+    # send the first request right away, so iterating over multiple
+    # media servers or containers is processed concurrently
+    return _iterate(func(0, limit), func, translate, limit, depth, threshold)
+
+
+def _iterate(future, func, translate, limit, depth, threshold=0):
+    # a media server may choose to return less than `limit` objects,
+    # so only pipeline requests for subsequent pages after receiving
+    # a full page; otherwise, continue where the last page ended
     count = 0
-    future = func(count, limit)
-    while future:
+    offset = limit
+    futures = collections.deque([future])
+    # pages of at least `threshold` objects are translated in a worker
+    # thread while waiting for the next page
+    pending = collections.deque()
+    while futures:
         try:
-            objs, more = future.get()
+            objs, more = futures.popleft().get()
         except Exception:
             # some media servers will raise a DBusException when
             # iterating beyond the last item, which may happen with
@@ -54,19 +175,28 @@ def iterate(func, translate, limit):
                 break
             else:
                 raise
-        if more:
-            objs = list(objs)
-            count += len(objs)
-            future = func(count, limit)
+        objs = list(objs)
+        count += len(objs)
+        if not (more and objs):
+            futures.clear()
+        elif limit and len(objs) == limit:
+            while len(futures) < depth:
+                futures.append(func(offset, limit))
+                offset += limit
         else:
-            future = None
-        for obj in objs:
-            try:
-                result = translate(obj)
-            except ValueError as e:
-                logger.debug("Skipping %s: %s", obj.get("URI"), e)
-            else:
-                yield result
+            futures.clear()
+            futures.append(func(count, limit))
+            offset = count + limit
+        if threshold and len(objs) >= threshold:
+            pending.append(aio.executor().submit(aio.translate_all, translate, objs))
+            while len(pending) > (1 if futures else 0):
+                yield from pending.popleft().result()
+        else:
+            while pending:
+                yield from pending.popleft().result()
+            yield from aio.translate_all(translate, objs)
+    while pending:
+        yield from pending.popleft().result()
 
 
 class dLeynaLibraryProvider(backend.LibraryProvider):
@@ -76,16 +206,72 @@ class dLeynaLibraryProvider(backend.LibraryProvider):
         name="Digital Media Servers",
     )
 
+    __discovering = models.Ref.directory(
+        uri=root_directory.uri,
+        name="Discovering media servers...",
+    )
+
     def __init__(self, backend, config):
         super().__init__(backend)
         ext_config = config[Extension.ext_name]
         self.__upnp_browse_limit = ext_config["upnp_browse_limit"]
         self.__upnp_lookup_limit = ext_config["upnp_lookup_limit"]
         self.__upnp_search_limit = ext_config["upnp_search_limit"]
+        self.__upnp_pipeline_depth = ext_config["upnp_pipeline_depth"]
+        self.__lookup_max_tracks = ext_config["lookup_max_tracks"]
+        self.__search_timeout = ext_config["search_timeout"]
+        self.__search_first_page = ext_config["search_first_page"]
+        self.__search_order = [
+            key if key[:1] in "+-" else "+" + key
+            for key in ext_config["search_order"] or []
+        ]
+        self.__search_max_results = ext_config["search_max_results"]
+        self.__translate_threshold = ext_config["translate_threshold"]
+        # parent containers and types of browsed objects
+        self.__parents = cache.Cache(PARENTS_CACHE_SIZE)
+        self.__types = cache.Cache(PARENTS_CACHE_SIZE)
+        # images by object and album URI, and shared image instances
+        self.__images_cache = cache.Cache(IMAGES_CACHE_SIZE)
+        self.__album_images = cache.Cache(IMAGES_CACHE_SIZE)
+        self.__image_models = cache.Cache(IMAGES_CACHE_SIZE)
+        metrics.registry.register_cache("images", self.__images_cache)
+        metrics.registry.register_cache("parents", self.__parents)
+        self.__limits = {
+            "browse": self.__upnp_browse_limit,
+            "lookup": self.__upnp_lookup_limit,
+            "search": self.__upnp_search_limit,
+        }
+        if ext_config["upnp_adaptive_limits"]:
+            self.__profiles = profile.Profiles(
+                Extension.get_data_dir(config) / "profiles.json", self.__limits
+            )
+        else:
+            self.__profiles = None
+        if ext_config["search_index"]:
+            data_dir = Extension.get_data_dir(config)
+            self.__index = index.LibraryIndex(
+                data_dir / "index.db", ext_config["search_index_max_age"]
+            )
+            checkpoints = data_dir / "crawler"
+            checkpoints.mkdir(exist_ok=True)
+            self.__crawler = crawler.Crawler(
+                backend.client,
+                self.__index,
+                checkpoints,
+                SEARCH_FILTER,
+                self.__upnp_browse_limit,
+                ext_config["crawler_concurrency"],
+                ext_config["crawler_rate_limit"],
+            )
+        else:
+            self.__index = self.__crawler = None
+        backend.client.add_server_listener(self.__server_changed)
 
     def browse(self, uri):
         if uri == self.root_directory.uri:
             refs = sorted(self.__servers, key=operator.attrgetter("name"))
+            if self.backend.client.discovering():
+                refs.append(self.__discovering)
         else:
             refs = self.__browse(uri)
         return list(refs)
@@ -93,25 +279,27 @@ class dLeynaLibraryProvider(backend.LibraryProvider):
     def get_images(self, uris):
         # TODO: suggest as API improvement
         uris = frozenset(uris)
-        # group uris by authority (media server)
-        queries = collections.defaultdict(list)
+        result = {}
         for uri in uris.difference([self.root_directory.uri]):
-            parts = uritools.urisplit(uri)
-            baseuri = parts.scheme + "://" + parts.authority
-            queries[baseuri].append(parts.path)
-        # start searching - blocks only when iterating over results
+            try:
+                result[uri] = self.__cached_images(uri)
+            except KeyError:
+                pass
+        # start retrieving - blocks only when iterating over results
         results = []
-        for baseuri, paths in queries.items():
+        for baseuri, paths in self.__group(uris.difference(result)).items():
             try:
-                iterable = self.__images(baseuri, paths)
+                calls, depth = self.__images(baseuri, paths)
             except NotImplementedError as e:
                 logger.warning("Not retrieving images for %s: %s", baseuri, e)
             else:
-                results.append(iterable)
-        # merge results
-        result = {}
-        for uri, images in itertools.chain.from_iterable(results):
-            result[uri] = tuple(images)
+                results.append(dispatch(calls, depth))
+        # merge results, which may also contain siblings
+        for objs in itertools.chain.from_iterable(results):
+            for uri, images in objs:
+                images = self.__cache_images(uri, images)
+                if uri in uris:
+                    result[uri] = images
         if self.root_directory.uri in uris:
             result[self.root_directory.uri] = tuple()
         return result
@@ -123,30 +311,69 @@ class dLeynaLibraryProvider(backend.LibraryProvider):
             tracks = self.__lookup(uri)
         return list(tracks)
 
+    def lookup_many(self, uris):
+        uris = frozenset(uris)
+        result = {uri: [] for uri in uris}
+        # retrieve objects in batches per media server
+        results = []
+        for baseuri, paths in self.__group(uris).items():
+            try:
+                results.append(dispatch(*self.__objects(baseuri, paths)))
+            except LookupError as e:
+                logger.warning("Not looking up %s: %s", baseuri, e)
+        objs = {}
+        for obj in itertools.chain.from_iterable(itertools.chain(*results)):
+            if obj["URI"] in uris:
+                objs[obj["URI"]] = obj
+        # expand containers in parallel
+        containers = {}
+        for uri, obj in objs.items():
+            try:
+                if translator.ref(obj).type == models.Ref.TRACK:
+                    result[uri] = [self.__track(obj)]
+                else:
+                    containers[uri] = self.__tracks(uri)
+            except Exception as e:
+                logger.warning("Error looking up %s: %s", uri, e)
+        for uri, tracks in containers.items():
+            try:
+                result[uri] = list(tracks)
+            except Exception as e:
+                logger.warning("Error looking up %s: %s", uri, e)
+        return result
+
     def refresh(self, uri=None):
         logger.info("Refreshing dLeyna library")
+        self.__images_cache.clear()
+        self.__album_images.clear()
+        self.backend.urls.clear()
         self.backend.client.rescan().get()
 
     def search(self, query=None, uris=None, exact=False):
-        # sanitize uris - remove duplicates, replace root with server uris
-        uris = set(uris or [self.root_directory.uri])
-        if self.root_directory.uri in uris:
-            uris.update(ref.uri for ref in self.__servers)
-            uris.remove(self.root_directory.uri)
-        # start searching - blocks only when iterating over results
-        results = []
-        for uri in uris:
+        # search media servers concurrently
+        searches = collections.OrderedDict()
+        for uri in self.__search_uris(uris):
             try:
-                iterable = self.__search(uri, query, exact)
-            except NotImplementedError as e:
+                searches[uri] = self.__search(uri, query, exact)
+            except (LookupError, NotImplementedError) as e:
                 logger.warning("Not searching %s: %s", uri, e)
-            else:
-                results.append(iterable)
-        if not results:
+        if not searches:
             return None
-        # retrieve and merge search results - TODO: handle exceptions?
+        results = aio.run(aio.gather(*searches.values()))
+        # merge sorted search results
+        streams = []
+        for uri, pairs in zip(searches, results):
+            if isinstance(pairs, asyncio.TimeoutError):
+                logger.warning("Search of %s timed out", uri)
+            elif isinstance(pairs, BaseException):
+                logger.warning("Error searching %s: %s", uri, pairs)
+            else:
+                streams.append(pairs)
+        merged = heapq.merge(*streams, key=operator.itemgetter(0))
+        if self.__search_max_results:
+            merged = itertools.islice(merged, self.__search_max_results)
         result = collections.defaultdict(collections.OrderedDict)
-        for model in itertools.chain.from_iterable(results):
+        for _, model in merged:
             result[type(model)][model.uri] = model
         return models.SearchResult(
             albums=result[models.Album].values(),
@@ -154,56 +381,494 @@ class dLeynaLibraryProvider(backend.LibraryProvider):
             tracks=result[models.Track].values(),
         )
 
+    def search_page(self, query=None, uris=None, exact=False, limit=50, cursor=None):
+        """Search for the first `limit` results, in search order.
+
+        Returns a :class:`mopidy.models.SearchResult` and an opaque
+        cursor for retrieving the next results by passing it to this
+        method instead of `query`, `uris` and `exact`, or :const:`None`
+        if there are no more results.  Media servers that fail to
+        respond are searched again for the next results, while media
+        servers that are no longer available are skipped.
+
+        """
+        if cursor:
+            query, exact, offsets = decode_cursor(cursor)
+        else:
+            offsets = {uri: 0 for uri in self.__search_uris(uris)}
+        searches = collections.OrderedDict()
+        for uri, offset in sorted(offsets.items()):
+            try:
+                searches[uri] = self.__search_page(uri, query, exact, offset, limit)
+            except (LookupError, NotImplementedError, ValueError) as e:
+                logger.warning("Not searching %s: %s", uri, e)
+        results = aio.run(aio.gather(*searches.values()))
+        pages = {}
+        failed = {}
+        for uri, page in zip(searches, results):
+            if isinstance(page, asyncio.TimeoutError):
+                logger.warning("Search of %s timed out", uri)
+                failed[uri] = offsets[uri]
+            elif isinstance(page, BaseException):
+                logger.warning("Error searching %s: %s", uri, page)
+                failed[uri] = offsets[uri]
+            else:
+                pages[uri] = page
+        # merge pages and continue after the last result used
+        merged = heapq.merge(
+            *(
+                [(key, uri, pos, model) for key, pos, model in pages[uri][0]]
+                for uri in pages
+            ),
+            key=operator.itemgetter(0),
+        )
+        used = collections.Counter()
+        result = collections.defaultdict(collections.OrderedDict)
+        for _, uri, _, model in itertools.islice(merged, limit):
+            used[uri] += 1
+            result[type(model)][model.uri] = model
+        # retry failed searches with the next page
+        offsets = failed
+        for uri, (items, more, end) in pages.items():
+            if used[uri] < len(items):
+                offsets[uri] = items[used[uri]][1]
+            elif more:
+                offsets[uri] = end
+        if offsets:
+            cursor = encode_cursor(query, exact, offsets)
+        else:
+            cursor = None
+        return (
+            models.SearchResult(
+                albums=result[models.Album].values(),
+                artists=result[models.Artist].values(),
+                tracks=result[models.Track].values(),
+            ),
+            cursor,
+        )
+
     def __browse(self, uri, filter=BROWSE_FILTER):
         client = self.backend.client
-        obj = client.properties(uri, iface=client.MEDIA_OBJECT_IFACE).get()
-        order = BROWSE_ORDER[translator.ref(obj).type]
+        server = client.server(uri).get() if self.__profiles else None
+        limit = self.__limit(server, "browse")
+
+        def browse(offset, limit, order):
+            future = client.browse(uri, offset, limit, filter, order)
+            return self.__measure(server, "browse", future, limit)
 
-        def browse(offset, limit):
-            return client.browse(uri, offset, limit, filter, order)
+        # object types are usually known from browsing the parent
+        try:
+            type = self.__types.get(uri)
+        except KeyError:
+            # browse using default order while retrieving object type
+            order = BROWSE_ORDER[models.Ref.DIRECTORY]
+            future = client.properties(uri, iface=client.MEDIA_OBJECT_IFACE)
+            first = browse(0, limit, order)
+            type = translator.ref(future.get()).type
+            if BROWSE_ORDER[type] != order:
+                first = None
+        else:
+            first = None
+        func = functools.partial(browse, order=BROWSE_ORDER[type])
 
-        return iterate(browse, translator.ref, self.__upnp_browse_limit)
+        def translate(obj):
+            ref = translator.ref(obj)
+            self.__parents.set(ref.uri, (uri, type))
+            self.__types.set(ref.uri, ref.type)
+            return ref
+
+        return _iterate(
+            first or func(0, limit),
+            func,
+            translate,
+            limit,
+            self.__upnp_pipeline_depth,
+            self.__translate_threshold,
+        )
 
     def __images(self, baseuri, paths, filter=IMAGES_FILTER):
         client = self.backend.client
         server = client.server(baseuri).get()
-        # fall back on properties if path search is not available/enabled
-        if self.__upnp_lookup_limit == 1 or "Path" not in server["SearchCaps"]:
-            futures = [client.properties(baseuri + path) for path in paths]
-            return (translator.images(f.get()) for f in futures)
+        limit = self.__upnp_lookup_limit
         # use path search for retrieving multiple results at once
-        root = server["Path"]
+        if limit != 1 and "Path" in server["SearchCaps"]:
 
-        def images(offset, limit):
-            slice = paths[offset : offset + limit if limit else None]
-            query = " or ".join(f'Path = "{root}{p}"' for p in slice)
-            return client.search(baseuri, query, 0, 0, filter).map(
-                lambda res: (res[0], limit and offset + limit < len(paths))
+            def images(call):
+                return call().map(lambda objs: list(map(translator.images, objs)))
+
+            calls = self.__pathsearch(server, baseuri, paths, filter)
+            calls = [functools.partial(images, call) for call in calls]
+            return calls, self.__pathsearch_concurrency
+        # browse parent containers of known siblings, if any
+        siblings = collections.defaultdict(set)
+        for path in paths:
+            uri = baseuri + path
+            try:
+                parent, _ = self.__parents.get(uri)
+            except KeyError:
+                siblings[None].add(uri)
+            else:
+                siblings[parent].add(uri)
+        counts = {
+            parent: client.properties(parent, client.MEDIA_CONTAINER_IFACE)
+            for parent, uris in siblings.items()
+            if parent is not None and len(uris) > 1
+        }
+
+        def browse(parent):
+            def page(offset, limit):
+                future = client.browse(parent, offset, limit, filter)
+                return self.__measure(server, "browse", future, limit)
+
+            return _Results(
+                iterate(
+                    page,
+                    translator.images,
+                    self.__limit(server, "browse"),
+                    self.__upnp_pipeline_depth,
+                )
             )
 
-        return iterate(images, translator.images, self.__upnp_lookup_limit)
+        def properties(uri):
+            return client.properties(uri).map(lambda obj: [translator.images(obj)])
 
-    def __lookup(self, uri, filter=LOOKUP_FILTER):
+        calls = []
+        for parent, uris in siblings.items():
+            if parent in counts and self.__siblings(parent, uris, counts[parent]):
+                calls.append(functools.partial(browse, parent))
+            else:
+                calls.extend(functools.partial(properties, uri) for uri in uris)
+        # bound number of parallel requests by lookup limit
+        return calls, max(limit or len(calls), self.__upnp_pipeline_depth)
+
+    @classmethod
+    def __siblings(cls, parent, uris, future):
+        # only browse parents if requested objects are a large share
+        # of their children
+        try:
+            count = future.get()["ChildCount"]
+        except Exception as e:
+            logger.debug("Cannot retrieve child count of %s: %s", parent, e)
+            return False
+        else:
+            return len(uris) >= count * SIBLINGS_SHARE
+
+    @property
+    def __pathsearch_concurrency(self):
+        return max(PATHSEARCH_CONCURRENCY, self.__upnp_pipeline_depth)
+
+    def __pathsearch(self, server, baseuri, paths, filter):
+        client = self.backend.client
+        limit = self.__limit(server, "lookup")
+        root = server["Path"]
+
+        def search(paths):
+            query = " or ".join(f'Path = "{root}{p}"' for p in paths)
+            future = client.search(baseuri, query, 0, 0, filter)
+            future = self.__measure(server, "lookup", future, limit, len(paths))
+            return future.map(lambda res: list(res[0]))
+
+        if limit:
+            chunks = [paths[i : i + limit] for i in range(0, len(paths), limit)]
+        else:
+            chunks = [paths]
+        return [functools.partial(search, chunk) for chunk in chunks]
+
+    def __cached_images(self, uri):
+        try:
+            return self.__images_cache.get(uri)
+        except KeyError:
+            parent, type = self.__parents.get(uri)
+        if type == models.Ref.ALBUM:
+            return self.__album_images.get(parent)
+        else:
+            raise KeyError(uri)
+
+    def __cache_images(self, uri, images):
+        result = []
+        for image in images:
+            try:
+                result.append(self.__image_models.get(image.uri))
+            except KeyError:
+                self.__image_models.set(image.uri, image)
+                result.append(image)
+        result = tuple(result)
+        self.__images_cache.set(uri, result)
+        # tracks of an album usually share the same album art
+        try:
+            parent, type = self.__parents.get(uri)
+        except KeyError:
+            pass
+        else:
+            if result and type == models.Ref.ALBUM:
+                self.__album_images.set(parent, result)
+        return result
+
+    def __lookup(self, uri):
         client = self.backend.client
         obj = client.properties(uri).get()
         if translator.ref(obj).type == models.Ref.TRACK:
-            objs = [obj]
+            return [self.__track(obj)]
         else:
-            objs, _ = client.search(uri, LOOKUP_QUERY, filter=filter).get()
-        return map(translator.track, objs)
+            return self.__tracks(uri)
+
+    def __objects(self, baseuri, paths, filter=LOOKUP_FILTER):
+        client = self.backend.client
+        server = client.server(baseuri).get()
+        limit = self.__upnp_lookup_limit
+        if limit != 1 and "Path" in server["SearchCaps"]:
+            calls = self.__pathsearch(server, baseuri, paths, filter)
+            return calls, self.__pathsearch_concurrency
+
+        def properties(uri):
+            return client.properties(uri).map(lambda obj: [obj])
+
+        calls = [functools.partial(properties, baseuri + path) for path in paths]
+        return calls, max(limit or len(calls), self.__upnp_pipeline_depth)
 
-    def __search(self, uri, query, exact, filter=SEARCH_FILTER):
+    def __tracks(self, uri, filter=LOOKUP_FILTER):
         client = self.backend.client
         server = client.server(uri).get()
+        if "Type" in server["SearchCaps"] or "*" in server["SearchCaps"]:
+
+            def search(offset, limit):
+                future = client.search(uri, LOOKUP_QUERY, offset, limit, filter)
+                return self.__measure(server, "search", future, limit)
+
+            tracks = iterate(
+                search,
+                self.__track,
+                self.__limit(server, "search"),
+                self.__upnp_pipeline_depth,
+                self.__translate_threshold,
+            )
+        else:
+            tracks = self.__walk(server, uri, filter)
+        if self.__lookup_max_tracks:
+            tracks = self.__truncate(uri, tracks, self.__lookup_max_tracks)
+        return tracks
+
+    def __walk(self, server, uri, filter):
+        client = self.backend.client
+        containers = collections.deque([uri])
+        while containers:
+            container = containers.popleft()
+
+            def browse(offset, limit, uri=container):
+                future = client.browse(uri, offset, limit, filter)
+                return self.__measure(server, "browse", future, limit)
+
+            objs = iterate(
+                browse,
+                self.__walk_translate,
+                self.__limit(server, "browse"),
+                self.__upnp_pipeline_depth,
+                self.__translate_threshold,
+            )
+            for track, obj in objs:
+                if track is not None:
+                    yield track
+                else:
+                    containers.append(obj["URI"])
+
+    def __walk_translate(self, obj):
+        if translator.ref(obj).type == models.Ref.TRACK:
+            return self.__track(obj), obj
+        else:
+            return None, obj
+
+    @classmethod
+    def __truncate(cls, uri, objs, count):
+        yield from itertools.islice(objs, count)
+        if next(objs, None) is not None:
+            logger.info("Lookup of %s truncated to %d tracks", uri, count)
+
+    def __group(self, uris):
+        # group uris by authority (media server)
+        queries = collections.defaultdict(list)
+        for uri in uris:
+            if uri != self.root_directory.uri:
+                parts = uritools.urisplit(uri)
+                queries[parts.scheme + "://" + parts.authority].append(parts.path)
+        return queries
+
+    def __search(self, uri, query, exact):
+        page, translate, limit, presorted = self.__source(uri, query, exact)
+        # only stop early if results are sorted by the media server
+        results = aio.collect(
+            page,
+            translate,
+            limit,
+            self.__upnp_pipeline_depth,
+            timeout=self.__search_timeout,
+            pages=1 if self.__search_first_page else 0,
+            maxcount=self.__search_max_results if presorted else 0,
+            threshold=self.__translate_threshold,
+            name=uri,
+        )
+        return results if presorted else self.__sorted(results)
+
+    def __search_uris(self, uris):
+        # sanitize uris - remove duplicates, replace root with server uris
+        uris = set(uris or [self.root_directory.uri])
+        if self.root_directory.uri in uris:
+            uris.update(ref.uri for ref in self.__servers)
+            uris.remove(self.root_directory.uri)
+        return sorted(uris)
+
+    def __search_page(self, uri, query, exact, offset, count):
+        # return coroutine for retrieving (key, position, model) items,
+        # whether there are more results, and the offset after the page
+        page, translate, limit, presorted = self.__source(uri, query, exact)
+
+        async def search():
+            objs, more = await page(offset, count)
+            items = []
+            for position, obj in enumerate(objs, offset):
+                try:
+                    key, model = translate(obj)
+                except ValueError as e:
+                    logger.debug("Skipping %s: %s", obj.get("URI"), e)
+                else:
+                    items.append((key, position, model))
+            return items, more, offset + len(objs)
+
+        async def search_all():
+            # results need to be sorted locally, so retrieve all of
+            # them and use offsets into the sorted results
+            results = await aio.collect(
+                page,
+                translate,
+                limit,
+                self.__upnp_pipeline_depth,
+                threshold=self.__translate_threshold,
+            )
+            results.sort(key=operator.itemgetter(0))
+            sliced = enumerate(results[offset : offset + count], offset)
+            items = [(key, position, model) for position, (key, model) in sliced]
+            return items, offset + count < len(results), offset + len(items)
+
+        timeout = self.__search_timeout or None
+        if presorted:
+            return asyncio.wait_for(search(), timeout)
+        else:
+            return asyncio.wait_for(search_all(), timeout)
+
+    def __source(self, uri, query, exact, filter=SEARCH_FILTER):
+        # return page and translate functions, page size and whether
+        # results are sorted for searching a media server
+        client = self.backend.client
+        server = client.server(uri).get()
+        order = self.__search_order
+        key = sortkey(order)
+        query = query or {}
+
+        def translate(obj):
+            return key(obj), self.__model(obj)
+
+        if self.__index and not uritools.urisplit(uri).path:
+            try:
+                if self.__index.fresh(server["UDN"]):
+                    objs = self.__index.search(server["UDN"], query, exact)
+
+                    def indexed(offset, limit):
+                        page = objs[offset : offset + limit if limit else None]
+                        return aio.completed((page, offset + len(page) < len(objs)))
+
+                    def translate_indexed(obj):
+                        # indexed playback URLs may be outdated
+                        return key(obj), translator.model(obj)
+
+                    return indexed, translate_indexed, 0, not order
+            except sqlite3.Error as e:
+                logger.warning("Error searching index for %s: %s", uri, e)
         if server["SearchCaps"]:
-            q = translator.query(query or {}, exact, server["SearchCaps"])
+            q, local = translator.plan(query, exact, server["SearchCaps"])
         else:
             raise NotImplementedError("Search is not supported by this device")
+        if local:
+            logger.debug("Matching %s locally for %s", ", ".join(local), uri)
+        localquery = {key: query[key] for key in local}
+
+        def match(obj):
+            if not translator.match(obj, localquery, exact):
+                raise ValueError("Object does not match query")
+            return translate(obj)
 
         def search(offset, limit):
-            return client.search(uri, q, offset, limit, filter)
+            future = client.search(uri, q, offset, limit, filter, order)
+            return aio.wait(self.__measure(server, "search", future, limit))
+
+        # media servers may sort differently, e.g. case-sensitive or
+        # with missing values first, so only rely on their order if
+        # results need not be sorted at all
+        return search, match, self.__limit(server, "search"), not order
+
+    @classmethod
+    async def __sorted(cls, aw):
+        return sorted(await aw, key=operator.itemgetter(0))
+
+    def __model(self, obj):
+        self.__cache_url(obj)
+        return translator.model(obj)
+
+    def __track(self, obj):
+        self.__cache_url(obj)
+        return translator.track(obj)
+
+    def __cache_url(self, obj):
+        # objects with multiple resources need to be resolved
+        urls = obj.get("URLs", ())
+        if len(urls) == 1:
+            self.backend.urls.set(obj["URI"], str(urls[0]))
+
+    def __limit(self, server, kind):
+        if self.__profiles is None:
+            return self.__limits[kind]
+        return self.__profiles.get(server["UDN"]).limit(kind)
+
+    def __measure(self, server, kind, future, limit, count=None):
+        # adapt limits to request latency and reply size, ignoring
+        # cached replies
+        if self.__profiles is None or future.done():
+            return future
+        start = time.monotonic()
+
+        def update(value, exc_info):
+            if exc_info is not None:
+                return
+            objs, more = value
+            if count is not None:
+                objs, more = range(count), False
+            elif kind != "search":
+                # without TotalMatches, a short page may just be the last
+                more = False
+            latency = time.monotonic() - start
+            self.__profiles.update(server["UDN"], kind, limit, len(objs), more, latency)
+
+        future.add_result_callback(update)
+        return future
 
-        return iterate(search, translator.model, self.__upnp_search_limit)
+    def __server_changed(self, action, server):
+        if action == "lost":
+            # media server may return with a different address, so
+            # drop playback and image URLs; shared image instances are
+            # keyed by their own URLs and therefore kept
+            prefix = server["URI"] + "/"
+            for c in (
+                self.backend.urls,
+                self.__images_cache,
+                self.__album_images,
+                self.__parents,
+                self.__types,
+            ):
+                c.invalidate(lambda uri: uri.startswith(prefix))
+        if self.__crawler is None:
+            pass
+        elif action == "lost":
+            self.__crawler.stop(server["UDN"])
+        elif not self.__index.fresh(server["UDN"]):
+            self.__crawler.start(server)
 
     @property
     def __servers(self):
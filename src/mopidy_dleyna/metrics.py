@@ -0,0 +1,148 @@
+import collections
+import logging
+import os
+import pathlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Call:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.objects = 0
+        self.latency = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+
+class Registry:
+    """Metrics for D-Bus calls and caches in Prometheus text format."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = collections.defaultdict(_Call)
+        self.__caches = {}
+
+    def clear(self):
+        with self.__lock:
+            self.__calls.clear()
+            self.__caches.clear()
+
+    def observe(self, method, udn, latency, objects=0, error=False):
+        with self.__lock:
+            call = self.__calls[(method, udn or "")]
+            call.count += 1
+            call.errors += int(error)
+            call.objects += objects
+            call.latency += latency
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    call.buckets[index] += 1
+
+    def register_cache(self, name, cache):
+        with self.__lock:
+            self.__caches[name] = cache
+
+    def render(self):
+        with self.__lock:
+            calls = sorted(self.__calls.items())
+            caches = sorted(self.__caches.items())
+        lines = []
+
+        def metric(name, type, help, samples):
+            lines.append(f"# HELP dleyna_{name} {help}")
+            lines.append(f"# TYPE dleyna_{name} {type}")
+            for suffix, labels, value in samples:
+                labels = ",".join('%s="%s"' % (k, _escape(v)) for k, v in labels)
+                lines.append(f"dleyna_{name}{suffix}{{{labels}}} {value}")
+
+        def labels(method, udn):
+            return [("method", method), ("udn", udn)]
+
+        metric(
+            "dbus_calls_total",
+            "counter",
+            "Number of D-Bus calls.",
+            [("", labels(*key), call.count) for key, call in calls],
+        )
+        metric(
+            "dbus_errors_total",
+            "counter",
+            "Number of failed D-Bus calls.",
+            [("", labels(*key), call.errors) for key, call in calls],
+        )
+        metric(
+            "dbus_objects_total",
+            "counter",
+            "Number of media objects returned by D-Bus calls.",
+            [("", labels(*key), call.objects) for key, call in calls],
+        )
+        samples = []
+        for key, call in calls:
+            for bound, count in zip(LATENCY_BUCKETS, call.buckets):
+                samples.append(("_bucket", labels(*key) + [("le", bound)], count))
+            samples.append(("_bucket", labels(*key) + [("le", "+Inf")], call.count))
+            samples.append(("_sum", labels(*key), call.latency))
+            samples.append(("_count", labels(*key), call.count))
+        metric(
+            "dbus_latency_seconds",
+            "histogram",
+            "Latency of D-Bus calls.",
+            samples,
+        )
+        metric(
+            "cache_hits_total",
+            "counter",
+            "Number of cache hits.",
+            [("", [("cache", name)], cache.hits) for name, cache in caches],
+        )
+        metric(
+            "cache_misses_total",
+            "counter",
+            "Number of cache misses.",
+            [("", [("cache", name)], cache.misses) for name, cache in caches],
+        )
+        metric(
+            "cache_size",
+            "gauge",
+            "Current size of cache.",
+            [("", [("cache", name)], cache.currsize) for name, cache in caches],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+registry = Registry()
+
+
+class Writer(threading.Thread):
+    """Periodically write metrics to a Prometheus text file."""
+
+    def __init__(self, path, interval, registry=registry):
+        super().__init__(name="dLeynaMetricsWriter", daemon=True)
+        self.__path = pathlib.Path(path)
+        self.__interval = interval
+        self.__registry = registry
+        self.__stopped = threading.Event()
+
+    def run(self):
+        while not self.__stopped.wait(self.__interval):
+            try:
+                self.__registry.write(self.__path)
+            except Exception as e:
+                logger.warning("Error writing metrics to %s: %s", self.__path, e)
+
+    def stop(self):
+        self.__stopped.set()
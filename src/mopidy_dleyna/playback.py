@@ -1,3 +1,4 @@
+import functools
 import logging
 
 from mopidy import backend
@@ -5,13 +6,51 @@ from mopidy import backend
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def protocol_info():
+    """Return UPnP protocol info for media types supported by GStreamer."""
+    try:
+        import gi
+
+        gi.require_version("Gst", "1.0")
+        from gi.repository import Gst
+    except (ImportError, ValueError) as e:
+        logger.debug("Cannot determine supported media types: %s", e)
+        return None
+    mimetypes = set()
+    for factory in Gst.ElementFactory.list_get_elements(
+        Gst.ELEMENT_FACTORY_TYPE_DECODABLE, Gst.Rank.MARGINAL
+    ):
+        for template in factory.get_static_pad_templates():
+            if template.direction == Gst.PadDirection.SINK:
+                caps = template.get_caps()
+                for index in range(caps.get_size()):
+                    mimetypes.add(caps.get_structure(index).get_name())
+    return ",".join("http-get:*:%s:*" % mimetype for mimetype in sorted(mimetypes))
+
+
 class dLeynaPlaybackProvider(backend.PlaybackProvider):
     def translate_uri(self, uri):
-        # TODO: GetCompatibleResources w/protocol_info
-        client = self.backend.client
+        urls = self.backend.urls
         try:
-            obj = client.properties(uri, client.MEDIA_ITEM_IFACE).get()
+            return urls.get(uri)
+        except KeyError:
+            pass
+        try:
+            url = self.__resolve(uri)
         except Exception as e:
             logger.error("Error translating %s: %s", uri, e)
         else:
-            return obj["URLs"][0]
+            urls.set(uri, url)
+            return url
+
+    def __resolve(self, uri):
+        client = self.backend.client
+        info = protocol_info()
+        if info:
+            try:
+                return str(client.resource(uri, info, ["URL"]).get()["URL"])
+            except Exception as e:
+                logger.debug("No compatible resource for %s: %s", uri, e)
+        obj = client.properties(uri, client.MEDIA_ITEM_IFACE).get()
+        return str(obj["URLs"][0])
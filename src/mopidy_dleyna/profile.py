@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# minimum number of objects per request when adapting page sizes
+MIN_LIMIT = 10
+
+# target number of seconds per request when adapting page sizes
+TARGET_LATENCY = 1.0
+
+
+class Profile:
+    """Adaptive request limits for a single media server.
+
+    Limits are adapted to the page size a media server actually
+    returns, and to the time it takes to respond: fast responses to
+    full pages double a limit up to its configured maximum, while slow
+    responses halve it.
+
+    """
+
+    def __init__(self, maxlimits, limits=None):
+        self.__maxlimits = maxlimits
+        self.__limits = dict(maxlimits)
+        for kind, limit in (limits or {}).items():
+            if self.__maxlimits.get(kind):
+                self.__limits[kind] = max(min(limit, maxlimits[kind]), 1)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.__limits)
+
+    def limit(self, kind):
+        return self.__limits[kind]
+
+    def limits(self):
+        return dict(self.__limits)
+
+    def update(self, kind, requested, received, more, latency):
+        """Update limit after a request, returning whether it changed.
+
+        `more` must only be true if the media server is known to have
+        more objects, i.e. a short page is not the last page.
+
+        """
+        maxlimit = self.__maxlimits[kind]
+        limit = self.__limits[kind]
+        if not maxlimit or requested != limit:
+            return False  # not adaptive, or limit changed in between
+        if more and 0 < received < requested:
+            # media server imposes its own page size
+            limit = received
+        elif latency > TARGET_LATENCY:
+            limit = max(limit // 2, min(MIN_LIMIT, limit))
+        elif latency < TARGET_LATENCY / 2 and received == requested:
+            limit = min(limit * 2, maxlimit)
+        if limit == self.__limits[kind]:
+            return False
+        else:
+            self.__limits[kind] = limit
+            return True
+
+
+class Profiles:
+    """Persistent media server profiles, keyed by UDN."""
+
+    def __init__(self, path, maxlimits):
+        self.__path = path
+        self.__maxlimits = maxlimits
+        self.__lock = threading.Lock()
+        try:
+            with path.open() as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except Exception as e:
+            logger.warning("Error loading media server profiles: %s", e)
+            data = {}
+        self.__profiles = {
+            udn: Profile(maxlimits, limits) for udn, limits in data.items()
+        }
+
+    def get(self, udn):
+        with self.__lock:
+            try:
+                return self.__profiles[udn.lower()]
+            except KeyError:
+                profile = self.__profiles[udn.lower()] = Profile(self.__maxlimits)
+                return profile
+
+    def update(self, udn, kind, requested, received, more, latency):
+        profile = self.get(udn)
+        with self.__lock:
+            if profile.update(kind, requested, received, more, latency):
+                logger.debug("Adapted %s limits: %r", udn, profile)
+                try:
+                    self.__save()
+                except Exception as e:
+                    logger.warning("Error saving media server profiles: %s", e)
+
+    def __save(self):
+        data = {udn: p.limits() for udn, p in self.__profiles.items()}
+        tmp = self.__path.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.__path)
@@ -1,9 +1,16 @@
+import functools
+import sys
+
 from mopidy import models
 
+# maximum number of shared album and artist instances
+MODELS_CACHE_SIZE = 1000
+
 _QUERY = {
     "any": lambda caps: (
         " or ".join(
-            s + ' {0} "{1}"' for s in caps & {"DisplayName", "Album", "Artist", "Genre"}
+            s + ' {0} "{1}"'
+            for s in sorted(caps & {"DisplayName", "Album", "Artist", "Genre"})
         )
     ),
     "album": lambda caps: ('Album {0} "{1}"' if "Album" in caps else None),
@@ -23,6 +30,38 @@ _QUERY = {
     "track_no": lambda caps: ('TrackNumber = "{1}"' if "TrackNumber" in caps else None),
 }
 
+# media object properties matched by query keywords
+QUERY_FIELDS = {
+    "any": ["DisplayName", "Album", "Artist", "Genre"],
+    "album": ["Album"],
+    "albumartist": ["Artist"],
+    "artist": ["Artist"],
+    "date": ["Date"],
+    "genre": ["Genre"],
+    "track_name": ["DisplayName"],
+    "track_no": ["TrackNumber"],
+}
+
+# query keywords always matched exactly, as in UPnP search criteria
+_EXACT_KEYWORDS = frozenset(["date", "track_no"])
+
+# query keywords in order of decreasing selectivity
+_SELECTIVITY = [
+    "track_name",
+    "album",
+    "albumartist",
+    "artist",
+    "genre",
+    "date",
+    "track_no",
+    "any",
+]
+
+_QUERY_TYPES = {
+    "albumartist": models.Ref.ALBUM,
+    "track_name": models.Ref.TRACK,
+}
+
 _REFS = {
     "audio": models.Ref.track,
     "container": models.Ref.directory,
@@ -38,17 +77,52 @@ _REFS = {
 }
 
 
+@functools.lru_cache(maxsize=MODELS_CACHE_SIZE)
+def _album_model(name):
+    return models.Album(name=name, uri=None)
+
+
+@functools.lru_cache(maxsize=MODELS_CACHE_SIZE)
+def _artist_model(name):
+    return models.Artist(name=name)
+
+
+@functools.lru_cache(maxsize=MODELS_CACHE_SIZE)
+def _artists_model(names):
+    # models keep frozensets as they are, so tracks may share them
+    return frozenset(map(_artist_model, names))
+
+
 def _album(obj):
     try:
         name = obj["Album"]
     except KeyError:
         return None
     else:
-        return models.Album(name=name, uri=None)
+        return _album_model(str(name))
 
 
 def _artists(obj):
-    return (models.Artist(name=name) for name in obj.get("Artists", []))
+    return _artists_model(tuple(str(name) for name in obj.get("Artists", ())))
+
+
+def _bitrate(value):
+    # DLNA bitrate is given in byte/s, but Mopidy wants kbit/s
+    return int((value * 8) / 1000) or None
+
+
+def _length(value):
+    return int(value) * 1000 or None
+
+
+# optional track fields: (model attribute, property name, converter)
+_TRACK_FIELDS = (
+    ("genre", "Genre", lambda value: sys.intern(str(value))),
+    ("track_no", "TrackNumber", int),
+    ("date", "Date", lambda value: sys.intern(str(value))),
+    ("length", "Duration", _length),
+    ("bitrate", "Bitrate", _bitrate),
+)
 
 
 def _quote(s):
@@ -62,48 +136,52 @@ def ref(obj):
     except KeyError:
         raise ValueError('Object type "%s" not supported' % type)
     else:
-        return translate(name=obj.get("DisplayName", obj["URI"]), uri=obj["URI"])
+        uri = str(obj["URI"])
+        return translate(name=str(obj.get("DisplayName", uri)), uri=uri)
 
 
 def album(obj):
+    num_tracks = obj.get("ItemCount", obj.get("ChildCount"))
     return models.Album(
-        uri=obj["URI"],
-        name=obj["DisplayName"],
-        artists=list(_artists(obj)),
-        num_tracks=obj.get("ItemCount", obj.get("ChildCount")),
+        uri=str(obj["URI"]),
+        name=str(obj["DisplayName"]),
+        artists=_artists(obj),
+        num_tracks=None if num_tracks is None else int(num_tracks),
     )
 
 
 def artist(obj):
-    return models.Artist(name=obj["DisplayName"], uri=obj["URI"])
+    return models.Artist(name=str(obj["DisplayName"]), uri=str(obj["URI"]))
 
 
 def track(obj):
+    kwargs = {
+        attr: convert(obj[name]) for attr, name, convert in _TRACK_FIELDS if name in obj
+    }
     return models.Track(
-        uri=obj["URI"],
-        name=obj["DisplayName"],
-        artists=list(_artists(obj)),
+        uri=str(obj["URI"]),
+        name=str(obj["DisplayName"]),
+        artists=_artists(obj),
         album=_album(obj),
-        genre=obj.get("Genre"),
-        track_no=obj.get("TrackNumber"),
-        date=obj.get("Date"),
-        length=obj.get("Duration", 0) * 1000 or None,
-        # DLNA bitrate is given in byte/s, but Mopidy wants kbit/s
-        bitrate=int((obj.get("Bitrate", 0) * 8) / 1000) or None,
+        **kwargs,
     )
 
 
+_MODELS = {
+    models.Ref.track: track,
+    models.Ref.album: album,
+    models.Ref.artist: artist,
+}
+
+
 def model(obj):
     type = obj.get("TypeEx", obj["Type"])
-    ref = _REFS.get(type)
-    if ref == models.Ref.track:
-        return track(obj)
-    elif ref == models.Ref.album:
-        return album(obj)
-    elif ref == models.Ref.artist:
-        return artist(obj)
-    else:
+    try:
+        translate = _MODELS[_REFS[type]]
+    except KeyError:
         raise ValueError('Object type "%s" not supported' % type)
+    else:
+        return translate(obj)
 
 
 def images(obj):
@@ -113,18 +191,63 @@ def images(obj):
         return obj["URI"], []
 
 
-def query(query, exact, searchcaps):
-    op = "=" if exact else "contains"
-    terms = []
+def match(obj, query, exact):
+    """Return whether a media object matches a Mopidy search query."""
+    try:
+        type = ref(obj).type
+    except (KeyError, ValueError):
+        return False
     for key, values in query.items():
-        try:
-            translate = _QUERY[key]
-        except KeyError:
+        if _QUERY_TYPES.get(key, type) != type:
+            return False
+        exactkey = exact or key in _EXACT_KEYWORDS
+        fields = [
+            value.casefold()
+            for name in QUERY_FIELDS[key]
+            for value in values_of(obj, name)
+        ]
+        for value in values:
+            value = str(value).casefold()
+            if exactkey and value not in fields:
+                return False
+            if not exactkey and not any(value in field for field in fields):
+                return False
+    return True
+
+
+def plan(query, exact, searchcaps):
+    """Return UPnP search criteria and keywords to match locally.
+
+    Keywords not supported by a media server are matched locally.  If
+    other keywords are searchable, the "any" keyword is also matched
+    locally to keep search criteria simple.
+
+    """
+    caps = frozenset(searchcaps)
+    pushdown = []
+    local = []
+    for key in query:
+        if key not in _QUERY:
             raise NotImplementedError('Keyword "%s" not supported' % key)
+    for key in sorted(query, key=_SELECTIVITY.index):
+        fmt = _QUERY[key](caps)
+        if fmt and (key != "any" or not pushdown):
+            pushdown.append((key, fmt))
         else:
-            fmt = translate(frozenset(searchcaps))
-        if fmt:
-            terms.extend(fmt.format(op, _quote(value)) for value in values)
-        else:
-            raise NotImplementedError('Keyword "%s" not searchable' % key)
-    return ("(%s)" % ") and (".join(terms)) or "*"
+            local.append(key)
+    if query and not pushdown:
+        raise NotImplementedError("Keywords %s not searchable" % ", ".join(local))
+    op = "=" if exact else "contains"
+    terms = [
+        fmt.format(op, _quote(value)) for key, fmt in pushdown for value in query[key]
+    ]
+    return ("(%s)" % ") and (".join(terms)) or "*", local
+
+
+def values_of(obj, name):
+    if name == "Artist" and "Artists" in obj:
+        return [str(artist) for artist in obj["Artists"]]
+    elif name in obj:
+        return [str(obj[name])]
+    else:
+        return []
@@ -1,4 +1,7 @@
 import logging
+import queue
+import sys
+import threading
 import time
 
 import pykka
@@ -10,6 +13,66 @@ class Future(pykka.ThreadingFuture):
 
     Timeout = pykka.Timeout
 
+    def __init__(self):
+        super().__init__()
+        self.__condition = threading.Condition()
+        self.__callbacks = []
+        self.__result = None
+
+    def add_done_callback(self, func):
+        self.add_result_callback(lambda value, exc_info: func(self))
+
+    def add_result_callback(self, func):
+        # `func` is passed the value and exception info, so it need not
+        # call get() on the setter thread
+        with self.__condition:
+            if self.__result is None:
+                self.__callbacks.append(func)
+                return
+            value, exc_info = self.__result
+        func(value, exc_info)
+
+    def done(self):
+        with self.__condition:
+            return self.__result is not None
+
+    def get(self, timeout=None):
+        # results are kept on the future rather than in pykka's queue,
+        # so any number of threads and callbacks may retrieve them
+        with self.__condition:
+            if not self.__condition.wait_for(self.done, timeout):
+                raise self.Timeout("%s seconds" % timeout)
+            value, exc_info = self.__result
+        if exc_info is None:
+            return value
+        exc_type, exc_value, exc_traceback = exc_info
+        if exc_value is None:
+            exc_value = exc_type()
+        raise exc_value.with_traceback(exc_traceback)
+
+    def map(self, func):
+        # apply `func` as soon as the result is available, so mapped
+        # futures also support done callbacks
+        future = self.__class__()
+
+        def callback(value, exc_info):
+            if exc_info is not None:
+                future.set_exception(exc_info)
+                return
+            try:
+                future.set(func(value))
+            except Exception:
+                future.set_exception()
+
+        self.add_result_callback(callback)
+        return future
+
+    def set(self, value=None):
+        self.__set_result(value, None)
+
+    def set_exception(self, exc_info=None):
+        self.__set_result(None, exc_info or sys.exc_info())
+
     @classmethod
     def exception(cls, exc=None):
         future = cls()
@@ -39,3 +102,16 @@ class Future(pykka.ThreadingFuture):
         future = cls()
         future.set(value)
         return future
+
+    def __set_result(self, value, exc_info):
+        with self.__condition:
+            if self.__result is not None:
+                raise queue.Full
+            self.__result = (value, exc_info)
+            callbacks, self.__callbacks = self.__callbacks, []
+            self.__condition.notify_all()
+        for func in callbacks:
+            try:
+                func(value, exc_info)
+            except Exception as e:
+                logger.error("Error in future callback: %s", e)
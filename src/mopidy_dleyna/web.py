@@ -0,0 +1,111 @@
+import json
+import logging
+
+from mopidy import models
+
+import pykka
+import tornado.web
+
+from . import library, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(metrics.registry.render())
+
+
+class SearchHandler(tornado.web.RequestHandler):
+    """Search with cursor-based continuation.
+
+    Accepts a JSON object with `query`, `uris`, `exact` and `limit`
+    members, or `cursor` and `limit` for retrieving further results,
+    and returns a JSON object with `result` and `cursor` members.
+
+    """
+
+    def post(self):
+        try:
+            kwargs = self.__parse(self.request.body)
+        except (TypeError, ValueError) as e:
+            raise tornado.web.HTTPError(400, "Invalid request: %s" % e)
+        provider = _library()
+        try:
+            result, cursor = provider.search_page(**kwargs).get()
+        except Exception as e:
+            logger.warning("Error searching: %s", e)
+            raise tornado.web.HTTPError(500)
+        self.set_header("Content-Type", "application/json")
+        self.write(
+            json.dumps(
+                {"result": result, "cursor": cursor}, cls=models.ModelJSONEncoder
+            )
+        )
+
+    @staticmethod
+    def __parse(body):
+        params = json.loads(body)
+        if not isinstance(params, dict):
+            raise ValueError("Expected JSON object")
+        kwargs = {
+            "query": params.get("query"),
+            "uris": params.get("uris"),
+            "exact": bool(params.get("exact", False)),
+            "limit": int(params.get("limit", 50)),
+            "cursor": params.get("cursor"),
+        }
+        if kwargs["query"] is not None and not isinstance(kwargs["query"], dict):
+            raise ValueError("Expected query object")
+        if kwargs["uris"] is not None and not isinstance(kwargs["uris"], list):
+            raise ValueError("Expected list of URIs")
+        if kwargs["limit"] < 1:
+            raise ValueError("Expected positive limit")
+        if kwargs["cursor"] is not None:
+            library.decode_cursor(kwargs["cursor"])
+        return kwargs
+
+
+class LookupHandler(tornado.web.RequestHandler):
+    """Look up multiple URIs at once.
+
+    Accepts a JSON object with a `uris` member and returns a JSON
+    object mapping each URI to a list of tracks.
+
+    """
+
+    def post(self):
+        try:
+            uris = json.loads(self.request.body)["uris"]
+            if not isinstance(uris, list) or not all(
+                isinstance(uri, str) for uri in uris
+            ):
+                raise ValueError("Expected list of URIs")
+        except (KeyError, TypeError, ValueError) as e:
+            raise tornado.web.HTTPError(400, "Invalid request: %s" % e)
+        provider = _library()
+        try:
+            result = provider.lookup_many(uris).get()
+        except Exception as e:
+            logger.warning("Error looking up URIs: %s", e)
+            raise tornado.web.HTTPError(500)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(result, cls=models.ModelJSONEncoder))
+
+
+def _library():
+    from .backend import dLeynaBackend
+
+    refs = pykka.ActorRegistry.get_by_class(dLeynaBackend)
+    if not refs:
+        raise tornado.web.HTTPError(503, "Backend not running")
+    return refs[0].proxy().library
+
+
+def factory(config, core):
+    return [
+        ("/metrics", MetricsHandler),
+        ("/search", SearchHandler),
+        ("/lookup", LookupHandler),
+    ]
@@ -15,6 +15,18 @@ def config():
             "upnp_browse_limit": 1000,
             "upnp_lookup_limit": 50,
             "upnp_search_limit": 100,
+            "upnp_pipeline_depth": 1,
+            "upnp_adaptive_limits": False,
+            "translate_threshold": 0,
+            "lookup_max_tracks": 0,
+            "search_timeout": 0,
+            "search_first_page": False,
+            "search_order": [],
+            "search_max_results": 0,
+            "search_index": False,
+            "search_index_max_age": 0,
+            "crawler_concurrency": 1,
+            "crawler_rate_limit": 0,
         }
     }
 
@@ -28,10 +40,11 @@ def client():
 @pytest.fixture
 def backend(config, audio, client):
     from mopidy import backend
-    from mopidy_dleyna import library, playback
+    from mopidy_dleyna import cache, library, playback
 
     backend_mock = mock.Mock(spec=backend.Backend)
     backend_mock.client = client
+    backend_mock.urls = cache.Cache(1000)
     backend_mock.library = library.dLeynaLibraryProvider(backend_mock, config)
     backend_mock.playback = playback.dLeynaPlaybackProvider(audio, backend_mock)
     return backend_mock
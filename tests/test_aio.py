@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from unittest import mock
+
+from mopidy_dleyna import aio
+from mopidy_dleyna.util import Future
+
+import pytest
+
+
+def test_future_callback():
+    future = Future()
+    mapped = future.map(lambda value: value + 1)
+    callback = mock.Mock()
+    mapped.add_done_callback(callback)
+    callback.assert_not_called()
+    future.set(41)
+    callback.assert_called_once_with(mapped)
+    assert mapped.get(timeout=0) == 42
+
+
+def test_future_get():
+    future = Future()
+    results = []
+    future.add_done_callback(lambda future: results.append(future.get()))
+    thread = threading.Thread(target=lambda: results.append(future.get()))
+    thread.start()
+    future.set(42)
+    thread.join(timeout=1)
+    # the result is not consumed by the first caller
+    assert results == [42, 42]
+    assert future.get(timeout=0) == 42
+
+
+def test_wait():
+    assert aio.run(aio.wait(Future.fromvalue(42))) == 42
+    with pytest.raises(LookupError):
+        aio.run(aio.wait(Future.exception(LookupError("foo"))))
+    with pytest.raises(asyncio.TimeoutError):
+        aio.run(aio.wait(Future(), timeout=0.01))
+
+
+def test_collect():
+    items = [1, 2, 3]
+    client = mock.Mock()
+    client.browse.side_effect = lambda uri, offset, limit, *args: Future.fromvalue(
+        [items[offset : offset + limit], offset + limit < len(items)]
+    )
+
+    def browse(offset, limit):
+        return aio.wait(client.browse("dleyna://foo", offset, limit))
+
+    assert aio.run(aio.collect(browse, str, 2, 2)) == ["1", "2", "3"]
+    assert aio.run(aio.collect(browse, str, 2, threshold=2)) == ["1", "2", "3"]
+
+
+def test_gather():
+    async def fail():
+        raise ValueError("foo")
+
+    results = aio.run(
+        aio.gather(aio.completed(1), fail(), asyncio.sleep(1), timeout=0.01)
+    )
+    assert results[0] == 1
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], asyncio.TimeoutError)
+
+
+def test_collect_timeout(caplog):
+    def page(offset, limit):
+        return aio.completed(([offset], True)) if offset == 0 else asyncio.sleep(1)
+
+    results = aio.run(aio.collect(page, str, 1, timeout=0.01, name="dleyna://foo"))
+    assert results == ["0"]
+    assert "Timeout retrieving dleyna://foo" in caplog.text
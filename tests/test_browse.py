@@ -1,7 +1,9 @@
+import threading
 from unittest import mock
 
 from mopidy.models import Ref
 
+from mopidy_dleyna import library
 from mopidy_dleyna.util import Future
 
 import pytest
@@ -40,12 +42,23 @@ def items():
 def test_browse_root(backend, servers):
     with mock.patch.object(backend, "client") as m:
         m.servers.return_value = Future.fromvalue(servers)
+        m.discovering.return_value = False
         assert backend.library.browse(backend.library.root_directory.uri) == [
             Ref.directory(name="Media Server #1", uri="dleyna://media1"),
             Ref.directory(name="Media Server #2", uri="dleyna://media2"),
         ]
 
 
+def test_browse_discovering(backend, servers):
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue(servers[0:1])
+        m.discovering.return_value = True
+        assert backend.library.browse(backend.library.root_directory.uri) == [
+            Ref.directory(name="Media Server #1", uri="dleyna://media1"),
+            Ref.directory(name="Discovering media servers...", uri="dleyna:"),
+        ]
+
+
 def test_browse_items(backend, container, items):
     # FIXME: how to patch multiple object methods...
     with mock.patch.object(backend, "client") as m:
@@ -60,3 +73,89 @@ def test_browse_items(backend, container, items):
             Ref.track(name="Track #2", uri="dleyna://media/2"),
             Ref.track(name="Track #3", uri="dleyna://media/3"),
         ]
+
+
+def test_browse_pipelined(backend, config, container, items):
+    from mopidy_dleyna.library import dLeynaLibraryProvider
+
+    config["dleyna"]["upnp_browse_limit"] = 1
+    config["dleyna"]["upnp_pipeline_depth"] = 2
+    library = dLeynaLibraryProvider(backend, config)
+    with mock.patch.object(backend, "client") as m:
+        m.properties.return_value = Future.fromvalue(container)
+        m.browse.side_effect = lambda uri, offset, limit, *args: (
+            Future.fromvalue([items[offset : offset + limit], True])
+        )
+        assert library.browse(container["URI"]) == [
+            Ref.track(name="Track #1", uri="dleyna://media/1"),
+            Ref.track(name="Track #2", uri="dleyna://media/2"),
+            Ref.track(name="Track #3", uri="dleyna://media/3"),
+        ]
+        assert [c[0][1] for c in m.browse.call_args_list] == [0, 1, 2, 3, 4]
+
+
+def test_browse_types(backend, container, items):
+    album = {
+        "DisplayName": "Album",
+        "Type": "container",
+        "TypeEx": "container.album.musicAlbum",
+        "URI": "dleyna://media/album",
+    }
+    with mock.patch.object(backend, "client") as m:
+        m.properties.return_value = Future.fromvalue(container)
+        m.browse.side_effect = lambda uri, offset, *args: Future.fromvalue(
+            [[] if offset else [album], not offset]
+        )
+        assert backend.library.browse(container["URI"]) == [
+            Ref.album(name="Album", uri="dleyna://media/album")
+        ]
+        assert m.properties.call_count == 1
+        # object type known from browsing parent
+        m.browse.side_effect = lambda uri, offset, *args: Future.fromvalue(
+            [[] if offset else items, not offset]
+        )
+        assert len(backend.library.browse(album["URI"])) == 3
+        assert m.properties.call_count == 1
+        assert m.browse.call_args[0][4] == ["+TrackNumber", "+DisplayName"]
+
+
+def test_browse_album(backend, items):
+    album = {
+        "DisplayName": "Album",
+        "Type": "container",
+        "TypeEx": "container.album.musicAlbum",
+        "URI": "dleyna://media/album",
+    }
+    with mock.patch.object(backend, "client") as m:
+        m.properties.return_value = Future.fromvalue(album)
+        m.browse.side_effect = lambda uri, offset, *args: Future.fromvalue(
+            [[] if offset else items, not offset]
+        )
+        assert len(backend.library.browse(album["URI"])) == 3
+        # default order while retrieving type, then album order
+        assert [c[0][4] for c in m.browse.call_args_list[:2]] == [
+            ["+TypeEx", "+DisplayName"],
+            ["+TrackNumber", "+DisplayName"],
+        ]
+
+
+def test_browse_adaptive_limits(backend, config, container, items, tmp_path):
+    config["core"] = {"data_dir": str(tmp_path)}
+    config["dleyna"]["upnp_adaptive_limits"] = True
+    backend.library = library.dLeynaLibraryProvider(backend, config)
+
+    def browse(uri, offset, limit, *args):
+        # replies must not be done yet for measuring latency
+        future = Future()
+        objs = items[offset : offset + limit]
+        threading.Timer(0.01, future.set, [[objs, bool(objs)]]).start()
+        return future
+
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue({"UDN": "uuid:media"})
+        m.properties.return_value = Future.fromvalue(container)
+        m.browse.side_effect = browse
+        for _ in range(2):
+            assert len(backend.library.browse(container["URI"])) == len(items)
+        # last page of a container is not mistaken for a page size limit
+        assert m.browse.call_args[0][2] == config["dleyna"]["upnp_browse_limit"]
@@ -0,0 +1,51 @@
+from mopidy_dleyna.cache import Cache
+
+import pytest
+
+
+class Timer:
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+def test_lru():
+    cache = Cache(3, getsizeof=len)
+    cache.set("a", [1])
+    cache.set("b", [1, 2])
+    assert cache.get("a") == [1]
+    cache.set("c", [1])
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.currsize == 2
+    cache.set("d", [1, 2, 3, 4])
+    assert "d" not in cache
+    assert cache.currsize == 2
+
+
+def test_ttl():
+    timer = Timer()
+    cache = Cache(10, ttl=2, timer=timer)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5)
+    timer.time = 2
+    with pytest.raises(KeyError):
+        cache.get("a")
+    assert cache.get("b") == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(cache) == 1
+
+
+def test_invalidate():
+    cache = Cache(10)
+    cache.set(("/foo", 1), 1)
+    cache.set(("/foo/bar", 2), 2)
+    cache.set(("/baz", 3), 3)
+    cache.invalidate(lambda key: key[0].startswith("/foo"))
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.currsize == 0
@@ -0,0 +1,272 @@
+import importlib
+import json
+import sys
+import threading
+import time
+import types
+from unittest import mock
+
+import mopidy_dleyna  # noqa: F401 - import mopidy before stubbing dbus
+
+import pytest
+
+SERVER_PATH = "/com/intel/dLeynaServer/server/0"
+
+
+class Call:
+    def __init__(self, path, method, args, reply_handler, error_handler):
+        self.path = path
+        self.method = method
+        self.args = args
+        self.reply = reply_handler
+        self.error = error_handler
+
+
+class Bus:
+    """D-Bus connection stub recording method calls and signal receivers."""
+
+    def __init__(self):
+        self.calls = []
+        self.receivers = {}
+
+    def add_signal_receiver(self, handler, signal_name, **kwargs):
+        self.receivers[signal_name] = handler
+
+    def get_object(self, bus_name, path):
+        return Object(self, path)
+
+    def pending(self, method):
+        return [call for call in self.calls if call.method == method]
+
+    def reply(self, method, value):
+        call = self.pending(method)[0]
+        self.calls.remove(call)
+        call.reply(value)
+
+    def fail(self, method, error):
+        call = self.pending(method)[0]
+        self.calls.remove(call)
+        call.error(error)
+
+
+class Object:
+    def __init__(self, bus, path):
+        self.__bus = bus
+        self.__path = path
+
+    def __getattr__(self, method):
+        def call(*args, reply_handler, error_handler, **kwargs):
+            self.__bus.calls.append(
+                Call(self.__path, method, args, reply_handler, error_handler)
+            )
+
+        return call
+
+
+@pytest.fixture
+def bus():
+    return Bus()
+
+
+@pytest.fixture
+def module(bus):
+    # client module, imported with a stubbed dbus module
+    dbus = types.ModuleType("dbus")
+    dbus.PROPERTIES_IFACE = "org.freedesktop.DBus.Properties"
+    dbus.UInt32 = int
+    dbus.SessionBus = lambda mainloop=None: bus
+    dbus.bus = types.SimpleNamespace(BusConnection=lambda *args, **kwargs: bus)
+    with mock.patch.dict(sys.modules, {"dbus": dbus}):
+        sys.modules.pop("mopidy_dleyna.client", None)
+        yield importlib.import_module("mopidy_dleyna.client")
+
+
+@pytest.fixture
+def server():
+    return {
+        "FriendlyName": "Media Server",
+        "Path": SERVER_PATH,
+        "SearchCaps": ["*"],
+        "SortCaps": ["*"],
+        "SystemUpdateID": 1,
+        "UDN": "uuid:media",
+    }
+
+
+def start(module, bus, server, **kwargs):
+    kwargs = dict({"cache_size": 100, "cache_ttl": 300}, **kwargs)
+    client = module.dLeynaClient(**kwargs)
+    bus.reply("GetServers", [server["Path"]])
+    bus.reply("GetAll", dict(server))
+    return client
+
+
+def test_cache_container_update(module, bus, server):
+    client = start(module, bus, server)
+    uri = "dleyna://uuid:media/1"
+    client.properties(uri)
+    bus.reply("GetAll", {"Path": SERVER_PATH + "/1", "DisplayName": "Foo"})
+    client.browse(uri)
+    bus.reply("ListChildrenEx", [])
+    # served from cache
+    assert client.properties(uri).get()["DisplayName"] == "Foo"
+    assert client.browse(uri).get() == ([], False)
+    assert not bus.calls
+    # object properties may change with any container update
+    bus.receivers["ContainerUpdateIDs"]([(SERVER_PATH + "/2", 1)], path=SERVER_PATH)
+    client.browse(uri)
+    assert not bus.calls
+    client.properties(uri)
+    assert len(bus.pending("GetAll")) == 1
+
+
+def test_cache_invalidate_pending(module, bus, server):
+    client = start(module, bus, server)
+    uri = "dleyna://uuid:media/1"
+    future = client.browse(uri)
+    bus.receivers["ContainerUpdateIDs"]([(SERVER_PATH + "/1", 1)], path=SERVER_PATH)
+    bus.reply("ListChildrenEx", [])
+    assert future.get() == ([], False)
+    # reply may predate the update, so is not cached
+    client.browse(uri)
+    assert len(bus.pending("ListChildrenEx")) == 1
+
+
+def test_browse_uncached(module, bus, server):
+    client = start(module, bus, server)
+    uri = "dleyna://uuid:media/1"
+    for _ in range(2):
+        client.browse(uri, cached=False)
+        bus.reply("ListChildrenEx", [])
+    client.browse(uri)
+    assert len(bus.pending("ListChildrenEx")) == 1
+
+
+def test_single_flight(module, bus, server):
+    client = start(module, bus, server)
+    uri = "dleyna://uuid:media/1"
+    futures = [client.browse(uri, 0, 10) for _ in range(3)]
+    client.browse(uri, 10, 10)
+    assert len(bus.pending("ListChildrenEx")) == 2
+    bus.reply("ListChildrenEx", [])
+    assert [future.get() for future in futures] == [([], False)] * 3
+
+
+def test_single_flight_error(module, bus, server):
+    client = start(module, bus, server, cache_size=0)
+    uri = "dleyna://uuid:media/1"
+    futures = [client.properties(uri) for _ in range(2)]
+    bus.fail("GetAll", ValueError("Object not found"))
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.get()
+    # failed calls are not shared with later callers
+    client.properties(uri)
+    assert len(bus.pending("GetAll")) == 1
+
+
+def test_single_flight_invalidate(module, bus, server):
+    client = start(module, bus, server)
+    uri = "dleyna://uuid:media/1"
+    client.browse(uri)
+    bus.receivers["ContainerUpdateIDs"]([(SERVER_PATH + "/1", 1)], path=SERVER_PATH)
+    client.browse(uri)
+    assert len(bus.pending("ListChildrenEx")) == 2
+    client.rescan()
+    client.browse(uri)
+    assert len(bus.pending("ListChildrenEx")) == 3
+    assert len(bus.pending("Rescan")) == 1
+
+
+def test_servers_warm_restart(module, bus, server, tmp_path):
+    path = tmp_path / "servers.json"
+    gone = dict(server, Path=SERVER_PATH[:-1] + "1", UDN="uuid:gone")
+    with path.open("w") as f:
+        json.dump([server, gone], f)
+    client = module.dLeynaClient(servers_path=path)
+    listener = mock.Mock()
+    client.add_server_listener(listener)
+    # servers from last run are listed while discovering
+    assert client.discovering()
+    assert sorted(obj["UDN"] for obj in client.servers().get()) == [
+        "uuid:gone",
+        "uuid:media",
+    ]
+    bus.reply("GetServers", [SERVER_PATH])
+    assert client.discovering()
+    bus.reply("GetAll", dict(server))
+    assert not client.discovering()
+    assert [obj["UDN"] for obj in client.servers().get()] == ["uuid:media"]
+    # only confirmed servers are reported to listeners
+    assert [c[0][0] for c in listener.call_args_list] == ["found"]
+    with path.open() as f:
+        assert [obj["UDN"] for obj in json.load(f)] == ["uuid:media"]
+
+
+def test_servers_wait(module, bus, server, tmp_path):
+    path = tmp_path / "servers.json"
+    with path.open("w") as f:
+        json.dump([dict(server, Path="/old/path")], f)
+    client = module.dLeynaClient(servers_path=path)
+
+    def discover():
+        bus.reply("GetServers", [SERVER_PATH])
+        bus.reply("GetAll", dict(server))
+
+    threading.Timer(0.05, discover).start()
+    # object paths of servers from last run may have changed
+    assert client.server("dleyna://uuid:media").get()["Path"] == SERVER_PATH
+
+
+def test_servers_not_rediscovered(module, bus, server, tmp_path):
+    path = tmp_path / "servers.json"
+    with path.open("w") as f:
+        json.dump([server], f)
+    client = module.dLeynaClient(servers_path=path)
+    with mock.patch.object(client, "DISCOVERY_TIMEOUT", 0.01):
+        with pytest.raises(LookupError):
+            client.server("dleyna://uuid:media")
+    bus.reply("GetServers", [])
+    assert not client.discovering()
+    assert list(client.servers().get()) == []
+    with pytest.raises(LookupError):
+        client.server("dleyna://uuid:media")
+    with path.open() as f:
+        assert json.load(f) == []
+
+
+def test_resource_metrics(module, bus, server):
+    client = start(module, bus, server)
+    future = client.resource("dleyna://uuid:media/1", ["http-get:*:*:*"])
+    results = []
+    thread = threading.Thread(target=lambda: results.append(future.get()))
+    thread.start()
+    with mock.patch.object(module.metrics, "registry") as registry:
+        bus.reply("GetCompatibleResource", {"URI": "http://media/1.mp3"})
+    thread.join(timeout=1)
+    assert results == [{"URI": "http://media/1.mp3"}]
+    assert registry.observe.call_args[0][0] == "GetCompatibleResource"
+
+
+def test_servers_load_invalid(module, bus, server, tmp_path):
+    path = tmp_path / "servers.json"
+    for servers in [{"UDN": "uuid:media"}, [{"Path": SERVER_PATH}], ["foo"]]:
+        with path.open("w") as f:
+            json.dump(servers, f)
+        client = module.dLeynaClient(servers_path=path)
+        assert list(client.servers().get()) == []
+
+
+def test_servers_wait_once(module, bus, server, tmp_path):
+    path = tmp_path / "servers.json"
+    servers = [dict(server, UDN="uuid:%d" % n, Path="/old/%d" % n) for n in range(3)]
+    with path.open("w") as f:
+        json.dump(servers, f)
+    client = module.dLeynaClient(servers_path=path)
+    with mock.patch.object(client, "DISCOVERY_TIMEOUT", 0.1):
+        start = time.monotonic()
+        for obj in servers:
+            with pytest.raises(LookupError):
+                client.server("dleyna://" + obj["UDN"])
+        # discovery is only waited for once
+        assert time.monotonic() - start < 0.2
@@ -0,0 +1,120 @@
+import json
+import time
+from unittest import mock
+
+from mopidy_dleyna.crawler import Crawler
+from mopidy_dleyna.util import Future
+
+import pytest
+
+
+@pytest.fixture
+def server():
+    return {"FriendlyName": "Media", "UDN": "uuid:media", "URI": "dleyna://media"}
+
+
+@pytest.fixture
+def client():
+    objs = {
+        "dleyna://media": [
+            {"DisplayName": "Folder", "Type": "container", "URI": "dleyna://media/1"},
+            {"DisplayName": "Track #1", "Type": "music", "URI": "dleyna://media/2"},
+            {
+                "DisplayName": "Album",
+                "Type": "album.music",
+                "TypeEx": "container.album.musicAlbum",
+                "URI": "dleyna://media/3",
+            },
+        ],
+        "dleyna://media/1": [
+            {"DisplayName": "Track #2", "Type": "music", "URI": "dleyna://media/11"},
+        ],
+        "dleyna://media/3": [
+            {"DisplayName": "Track #3", "Type": "music", "URI": "dleyna://media/31"},
+        ],
+    }
+
+    def browse(uri, offset, limit, filter, cached=True):
+        assert not cached
+        return Future.fromvalue(
+            [objs[uri][offset : offset + limit if limit else None], True]
+        )
+
+    client = mock.Mock()
+    client.browse.side_effect = browse
+    return client
+
+
+def wait(crawler, udn, timeout=5.0):
+    start = time.time()
+    while time.time() < start + timeout:
+        progress = crawler.progress().get(udn)
+        if progress and progress.state not in ("idle", "running"):
+            return progress
+        time.sleep(0.01)
+    raise AssertionError("Crawler did not finish")
+
+
+def test_crawl(tmp_path, client, server):
+    sink = mock.Mock()
+    crawler = Crawler(client, sink, tmp_path, ["*"], 1, concurrency=2)
+    crawler.start(server)
+    progress = wait(crawler, "uuid:media")
+    assert progress.state == "complete"
+    assert progress.containers == 3
+    assert progress.objects == 5
+    sink.begin.assert_called_once_with("uuid:media")
+    sink.commit.assert_called_once_with("uuid:media")
+    assert [c[0][1][0]["URI"] for c in sink.add.call_args_list] == [
+        "dleyna://media/1",
+        "dleyna://media/2",
+        "dleyna://media/11",
+        "dleyna://media/3",
+        "dleyna://media/31",
+    ]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_restart(tmp_path, client, server):
+    browse = client.browse.side_effect
+    pending = Future()
+    client.browse.side_effect = lambda *args, **kwargs: (
+        pending if client.browse.call_count == 1 else browse(*args, **kwargs)
+    )
+    sink = mock.Mock()
+    crawler = Crawler(client, sink, tmp_path, ["*"], 0)
+    crawler.start(server)
+    while not client.browse.called:
+        time.sleep(0.01)
+    # server lost and found again while waiting for a reply
+    crawler.stop("uuid:media")
+    crawler.start(server)
+    pending.set(browse("dleyna://media", 0, 0, ["*"], cached=False).get())
+    start = time.time()
+    while not sink.commit.called and time.time() < start + 5.0:
+        time.sleep(0.01)
+    sink.commit.assert_called_once_with("uuid:media")
+    assert crawler.progress()["uuid:media"].objects == 5
+
+
+def test_resume(tmp_path, client, server):
+    with (tmp_path / "uuid%3Amedia.json").open("w") as f:
+        json.dump(
+            {
+                "queue": [["dleyna://media/1", 0]],
+                "progress": {"containers": 1, "objects": 2},
+            },
+            f,
+        )
+    sink = mock.Mock()
+    crawler = Crawler(client, sink, tmp_path, ["*"], 0)
+    crawler.start(server)
+    progress = wait(crawler, "uuid:media")
+    assert progress.state == "complete"
+    assert progress.objects == 3
+    sink.begin.assert_not_called()
+    sink.commit.assert_called_once_with("uuid:media")
+    assert [c[0][0] for c in client.browse.call_args_list] == [
+        "dleyna://media/1",
+        "dleyna://media/1",
+    ]
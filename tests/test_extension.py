@@ -12,4 +12,20 @@ def test_get_config_schema():
     assert "upnp_browse_limit" in schema
     assert "upnp_lookup_limit" in schema
     assert "upnp_search_limit" in schema
+    assert "upnp_pipeline_depth" in schema
+    assert "upnp_adaptive_limits" in schema
+    assert "translate_threshold" in schema
+    assert "cache_size" in schema
+    assert "cache_ttl" in schema
+    assert "lookup_max_tracks" in schema
+    assert "search_timeout" in schema
+    assert "search_first_page" in schema
+    assert "search_order" in schema
+    assert "search_max_results" in schema
+    assert "search_index" in schema
+    assert "search_index_max_age" in schema
+    assert "crawler_concurrency" in schema
+    assert "crawler_rate_limit" in schema
+    assert "metrics_file" in schema
     assert "dbus_start_session" in schema
+    assert "fast_start" in schema
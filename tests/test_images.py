@@ -40,3 +40,100 @@ def test_images(backend, server, items):
             items[0]["URI"]: (models.Image(uri=items[0]["AlbumArtURL"]),),
             items[1]["URI"]: tuple(),
         }
+
+
+def test_images_lost_server(backend, client, server, items):
+    listener = client.add_server_listener.call_args[0][0]
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue(server)
+        m.search.return_value = Future.fromvalue([items, False])
+        backend.library.get_images([items[0]["URI"]])
+        # album art URLs may change with the media server's address
+        listener("lost", server)
+        backend.library.get_images([items[0]["URI"]])
+        assert m.search.call_count == 2
+
+
+def test_images_properties(backend, server, items):
+    server["SearchCaps"] = []
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue(server)
+        m.properties.side_effect = [Future.fromvalue(item) for item in items]
+        assert backend.library.get_images(item["URI"] for item in items) == {
+            items[0]["URI"]: (models.Image(uri=items[0]["AlbumArtURL"]),),
+            items[1]["URI"]: tuple(),
+        }
+
+
+def test_images_siblings(backend, server, items):
+    server["SearchCaps"] = []
+    container = {
+        "ChildCount": 2,
+        "DisplayName": "Root",
+        "Type": "container",
+        "URI": "dleyna://media",
+    }
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue(server)
+        m.properties.return_value = Future.fromvalue(container)
+        m.browse.side_effect = lambda uri, offset, *args: Future.fromvalue(
+            [[] if offset else items, not offset]
+        )
+        backend.library.browse(container["URI"])
+        assert backend.library.get_images(item["URI"] for item in items) == {
+            items[0]["URI"]: (models.Image(uri=items[0]["AlbumArtURL"]),),
+            items[1]["URI"]: tuple(),
+        }
+        m.browse.assert_any_call(container["URI"], 0, 1000, ["AlbumArtURL", "URI"])
+        assert m.properties.call_count == 2
+
+
+def test_images_siblings_share(backend, server, items):
+    server["SearchCaps"] = []
+    container = {
+        "ChildCount": 100,
+        "DisplayName": "Root",
+        "Type": "container",
+        "URI": "dleyna://media",
+    }
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue(server)
+        m.properties.return_value = Future.fromvalue(container)
+        m.browse.side_effect = lambda uri, offset, *args: Future.fromvalue(
+            [[] if offset else items, not offset]
+        )
+        backend.library.browse(container["URI"])
+        m.properties.side_effect = [Future.fromvalue(container)] + [
+            Future.fromvalue(item) for item in items
+        ]
+        backend.library.get_images(item["URI"] for item in items)
+        # siblings are only a small share of the container's children
+        assert m.browse.call_count == 2
+        assert m.properties.call_count == 4
+
+
+def test_images_album(backend, server, items):
+    album = {
+        "DisplayName": "Album",
+        "Type": "container",
+        "TypeEx": "container.album.musicAlbum",
+        "URI": "dleyna://media",
+    }
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue(server)
+        m.properties.return_value = Future.fromvalue(album)
+        m.browse.side_effect = lambda uri, offset, *args: Future.fromvalue(
+            [[] if offset else items, not offset]
+        )
+        backend.library.browse(album["URI"])
+        m.search.return_value = Future.fromvalue([items[0:1], False])
+        images = backend.library.get_images([items[0]["URI"]])
+        assert images == {
+            items[0]["URI"]: (models.Image(uri=items[0]["AlbumArtURL"]),),
+        }
+        assert backend.library.get_images([items[1]["URI"]]) == {
+            items[1]["URI"]: images[items[0]["URI"]],
+        }
+        assert m.search.call_count == 1
+        image = backend.library.get_images([items[1]["URI"]])[items[1]["URI"]][0]
+        assert image is images[items[0]["URI"]][0]
@@ -0,0 +1,62 @@
+from unittest import mock
+
+from mopidy_dleyna import index
+
+import pytest
+
+
+@pytest.fixture
+def objs():
+    return [
+        {
+            "DisplayName": "Album #1",
+            "Artist": "Foo Fighters",
+            "Type": "container",
+            "TypeEx": "container.album.musicAlbum",
+            "URI": "dleyna://media/1",
+        },
+        {
+            "DisplayName": "Track #1",
+            "Artists": ["Foo Fighters"],
+            "Album": "Album #1",
+            "Type": "music",
+            "URI": "dleyna://media/11",
+        },
+        {
+            "DisplayName": "Video #1",
+            "Type": "video",
+            "URI": "dleyna://media/21",
+        },
+    ]
+
+
+@pytest.fixture
+def library(tmp_path, objs):
+    library = index.LibraryIndex(tmp_path / "index.db")
+    library.begin("uuid:media")
+    library.add("uuid:media", objs)
+    library.commit("uuid:media")
+    yield library
+    library.close()
+
+
+def test_fresh(tmp_path, library):
+    assert library.fresh("UUID:MEDIA")
+    library.begin("uuid:media")
+    assert not library.fresh("uuid:media")
+    library.commit("uuid:media")
+    assert library.fresh("uuid:media")
+    assert not library.fresh("uuid:other")
+    with mock.patch("time.time", return_value=1e12):
+        assert not index.LibraryIndex(tmp_path / "index.db", 60).fresh("uuid:media")
+
+
+def test_search(library, objs):
+    assert library.search("uuid:media", {"any": ["foo"]}) == objs[0:2]
+    assert library.search("uuid:media", {"artist": ["Fighters"]}) == objs[0:2]
+    assert library.search("uuid:media", {"artist": ["foo"]}, exact=True) == []
+    assert library.search("uuid:media", {"albumartist": ["foo"]}) == objs[0:1]
+    assert library.search("uuid:media", {"track_name": ["track"]}) == objs[1:2]
+    assert library.search("uuid:media", {}) == objs[0:2]
+    with pytest.raises(NotImplementedError):
+        library.search("uuid:media", {"composer": ["foo"]})
@@ -47,9 +47,92 @@ def test_lookup_item(backend, items):
 
 def test_lookup_container(backend, container, items):
     with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue({"SearchCaps": ["Type"]})
         m.properties.return_value = Future.fromvalue(container)
         m.search.return_value = Future.fromvalue([items, False])
         assert backend.library.lookup(container["URI"]) == [
             models.Track(name="Track #1", uri="dleyna://media/11"),
             models.Track(name="Track #2", uri="dleyna://media/12"),
         ]
+
+
+def test_lookup_many(backend, container, items):
+    server = {
+        "SearchCaps": ["Path", "Type"],
+        "Path": "/com/intel/dLeynaServer/server/0",
+        "URI": "dleyna://media",
+    }
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue(server)
+        m.search.side_effect = [
+            Future.fromvalue([[container, items[0]], False]),
+            Future.fromvalue([items, False]),
+        ]
+        uris = [backend.library.root_directory.uri, container["URI"], items[0]["URI"]]
+        assert backend.library.lookup_many(uris) == {
+            backend.library.root_directory.uri: [],
+            container["URI"]: [
+                models.Track(name="Track #1", uri="dleyna://media/11"),
+                models.Track(name="Track #2", uri="dleyna://media/12"),
+            ],
+            items[0]["URI"]: [models.Track(name="Track #1", uri="dleyna://media/11")],
+        }
+        query = m.search.call_args_list[0][0][1]
+        assert query.count("Path = ") == 2
+        m.properties.assert_not_called()
+
+
+def test_lookup_container_browse(backend, container, items):
+    folder = {"DisplayName": "Folder", "Type": "container", "URI": "dleyna://media/2"}
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue({"SearchCaps": []})
+        m.properties.return_value = Future.fromvalue(container)
+        m.browse.side_effect = [
+            Future.fromvalue([[items[0], folder], True]),
+            Future.fromvalue([[], True]),
+            Future.fromvalue([items[1:2], True]),
+            Future.fromvalue([[], True]),
+        ]
+        assert backend.library.lookup(container["URI"]) == [
+            models.Track(name="Track #1", uri="dleyna://media/11"),
+            models.Track(name="Track #2", uri="dleyna://media/12"),
+        ]
+        m.search.assert_not_called()
+
+
+def test_lookup_container_limit(backend, config, container, items):
+    from mopidy_dleyna.library import dLeynaLibraryProvider
+
+    config["dleyna"]["lookup_max_tracks"] = 1
+    library = dLeynaLibraryProvider(backend, config)
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue({"SearchCaps": ["Type"]})
+        m.properties.return_value = Future.fromvalue(container)
+        m.search.return_value = Future.fromvalue([items, False])
+        assert library.lookup(container["URI"]) == [
+            models.Track(name="Track #1", uri="dleyna://media/11"),
+        ]
+
+
+def test_lookup_container_threshold(backend, config, container):
+    from mopidy_dleyna.library import dLeynaLibraryProvider
+
+    config["dleyna"]["upnp_search_limit"] = 2
+    config["dleyna"]["upnp_pipeline_depth"] = 2
+    config["dleyna"]["translate_threshold"] = 2
+    library = dLeynaLibraryProvider(backend, config)
+    items = [
+        {"DisplayName": f"Track #{n}", "Type": "music", "URI": f"dleyna://media/{n}"}
+        for n in range(1, 8)
+    ]
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue({"SearchCaps": ["Type"]})
+        m.properties.return_value = Future.fromvalue(container)
+        m.search.side_effect = lambda uri, query, offset, limit, *args: (
+            Future.fromvalue(
+                [items[offset : offset + limit], offset + limit < len(items)]
+            )
+        )
+        assert library.lookup(container["URI"]) == [
+            models.Track(name=item["DisplayName"], uri=item["URI"]) for item in items
+        ]
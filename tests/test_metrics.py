@@ -0,0 +1,47 @@
+import time
+
+from mopidy import config
+
+from mopidy_dleyna import cache, metrics
+
+
+def test_render():
+    registry = metrics.Registry()
+    registry.observe("GetAll", "uuid:foo", 0.02, 1)
+    registry.observe("GetAll", "uuid:foo", 2.0, error=True)
+    c = cache.Cache(10)
+    c.set("foo", 1)
+    c.get("foo")
+    registry.register_cache("objects", c)
+    lines = registry.render().splitlines()
+    labels = 'method="GetAll",udn="uuid:foo"'
+    assert "dleyna_dbus_calls_total{%s} 2" % labels in lines
+    assert "dleyna_dbus_errors_total{%s} 1" % labels in lines
+    assert "dleyna_dbus_objects_total{%s} 1" % labels in lines
+    assert 'dleyna_dbus_latency_seconds_bucket{%s,le="0.025"} 1' % labels in lines
+    assert 'dleyna_dbus_latency_seconds_bucket{%s,le="+Inf"} 2' % labels in lines
+    assert "dleyna_dbus_latency_seconds_count{%s} 2" % labels in lines
+    assert 'dleyna_cache_hits_total{cache="objects"} 1' in lines
+    assert 'dleyna_cache_misses_total{cache="objects"} 0' in lines
+
+
+def test_write(tmp_path):
+    registry = metrics.Registry()
+    registry.observe("ListChildrenEx", None, 0.1, 10)
+    registry.write(tmp_path / "dleyna.prom")
+    assert (tmp_path / "dleyna.prom").read_text() == registry.render()
+
+
+def test_writer(tmp_path):
+    registry = metrics.Registry()
+    path = config.Path(optional=True).deserialize(str(tmp_path / "dleyna.prom"))
+    writer = metrics.Writer(path, 0.01, registry)
+    writer.start()
+    try:
+        for _ in range(100):
+            if (tmp_path / "dleyna.prom").exists():
+                break
+            time.sleep(0.01)
+    finally:
+        writer.stop()
+    assert (tmp_path / "dleyna.prom").read_text() == registry.render()
@@ -1,5 +1,6 @@
 from unittest import mock
 
+from mopidy_dleyna import playback
 from mopidy_dleyna.util import Future
 
 import pytest
@@ -25,3 +26,33 @@ def test_translate_unknown_uri(backend):
     with mock.patch.object(backend, "client") as m:
         m.properties.return_value = Future.exception(LookupError("Not Found"))
         assert backend.playback.translate_uri("") is None
+
+
+def test_translate_cached_uri(backend, item):
+    with mock.patch.object(backend, "client") as m:
+        m.properties.return_value = Future.fromvalue(item)
+        backend.library.lookup(item["URI"])
+        m.properties.reset_mock()
+        assert backend.playback.translate_uri(item["URI"]) == item["URLs"][0]
+        m.properties.assert_not_called()
+
+
+def test_translate_compatible_resource(backend, item):
+    info = "http-get:*:audio/mpeg:*"
+    with mock.patch.object(playback, "protocol_info", return_value=info):
+        with mock.patch.object(backend, "client") as m:
+            m.resource.return_value = Future.fromvalue({"URL": "http://foo"})
+            assert backend.playback.translate_uri(item["URI"]) == "http://foo"
+            m.resource.assert_called_once_with(item["URI"], info, ["URL"])
+            m.properties.assert_not_called()
+
+
+def test_translate_lost_server(backend, client, item):
+    listener = client.add_server_listener.call_args[0][0]
+    with mock.patch.object(backend, "client") as m:
+        m.properties.return_value = Future.fromvalue(item)
+        backend.library.lookup(item["URI"])
+        listener("lost", {"URI": "dleyna://media", "UDN": "media"})
+        m.properties.reset_mock()
+        assert backend.playback.translate_uri(item["URI"]) == item["URLs"][0]
+        m.properties.assert_called_once()
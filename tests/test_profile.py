@@ -0,0 +1,34 @@
+from mopidy_dleyna import profile
+
+
+def test_profile():
+    p = profile.Profile({"browse": 1000, "search": 0})
+    assert p.limit("browse") == 1000
+    # media server returns smaller pages
+    assert p.update("browse", 1000, 100, True, 0.1)
+    assert p.limit("browse") == 100
+    # fast responses to full pages
+    assert p.update("browse", 100, 100, True, 0.1)
+    assert p.limit("browse") == 200
+    # stale request limit
+    assert not p.update("browse", 100, 100, True, 0.1)
+    # slow responses
+    assert p.update("browse", 200, 200, True, 2.0)
+    assert p.limit("browse") == 100
+    # not adaptive
+    assert not p.update("search", 0, 100, True, 2.0)
+    assert p.limit("search") == 0
+
+
+def test_profiles(tmp_path):
+    path = tmp_path / "profiles.json"
+    profiles = profile.Profiles(path, {"browse": 1000})
+    profiles.update("uuid:Foo", "browse", 1000, 50, True, 0.1)
+    assert profiles.get("uuid:foo").limit("browse") == 50
+    assert profile.Profiles(path, {"browse": 1000}).get("uuid:foo").limits() == {
+        "browse": 50
+    }
+    # configured limit is upper bound
+    assert profile.Profiles(path, {"browse": 20}).get("uuid:foo").limits() == {
+        "browse": 20
+    }
@@ -2,6 +2,7 @@ from unittest import mock
 
 from mopidy import models
 
+from mopidy_dleyna import index, library
 from mopidy_dleyna.util import Future
 
 import pytest
@@ -59,3 +60,259 @@ def test_search(backend, server, result):
         assert backend.library.search({"composer": ["foo"]}) is None
         # search field not supported by device yields no result
         assert backend.library.search({"genre": ["foo"]}) is None
+
+
+def test_search_timeout(config, backend, server, result):
+    config["dleyna"]["search_timeout"] = 0.01
+    backend.library = library.dLeynaLibraryProvider(backend, config)
+    servers = [server, dict(server, URI="dleyna://slow")]
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue(servers)
+        m.server.side_effect = lambda uri: Future.fromvalue(
+            servers[uri == "dleyna://slow"]
+        )
+        m.search.side_effect = lambda uri, *args: (
+            Future() if uri == "dleyna://slow" else Future.fromvalue([result, False])
+        )
+        assert backend.library.search({"any": ["foo"]}) == models.SearchResult(
+            albums=[models.Album(name="Album #1", uri="dleyna://media/1")],
+            tracks=[
+                models.Track(name="Track #1", uri="dleyna://media/11"),
+                models.Track(name="Track #2", uri="dleyna://media/12"),
+            ],
+        )
+
+
+def test_search_lost_server(backend, server, result):
+    servers = [server, dict(server, URI="dleyna://lost")]
+
+    def get_server(uri):
+        if uri == "dleyna://lost":
+            raise LookupError("Media server lost not available")
+        return Future.fromvalue(server)
+
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue(servers)
+        m.server.side_effect = get_server
+        m.search.return_value = Future.fromvalue([result[1:], False])
+        assert len(backend.library.search({"any": ["foo"]}).tracks) == 2
+        result, cursor = backend.library.search_page({"any": ["foo"]})
+        assert len(result.tracks) == 2
+        assert cursor is None
+
+
+def test_search_first_page(config, backend, server, result):
+    config["dleyna"]["search_first_page"] = True
+    backend.library = library.dLeynaLibraryProvider(backend, config)
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue([server])
+        m.server.return_value = Future.fromvalue(server)
+        m.search.side_effect = [
+            Future.fromvalue([result[0:2], True]),
+            Future.fromvalue([result[2:3], False]),
+        ]
+        assert backend.library.search({"any": ["foo"]}) == models.SearchResult(
+            albums=[models.Album(name="Album #1", uri="dleyna://media/1")],
+            tracks=[models.Track(name="Track #1", uri="dleyna://media/11")],
+        )
+        assert m.search.call_count == 1
+
+
+def test_search_order(config, backend, server):
+    config["dleyna"]["search_order"] = ["-DisplayName"]
+    config["dleyna"]["search_max_results"] = 4
+    config["dleyna"]["upnp_search_limit"] = 2
+    backend.library = library.dLeynaLibraryProvider(backend, config)
+    servers = {
+        "dleyna://sorted": dict(server, URI="dleyna://sorted", SortCaps=["*"]),
+        "dleyna://unsorted": dict(server, URI="dleyna://unsorted", SortCaps=[]),
+    }
+    # media servers may sort case-sensitively
+    names = {"dleyna://sorted": "fdbECA", "dleyna://unsorted": "bdac"}
+
+    def search(uri, query, offset, limit, filter, order):
+        objs = [
+            {"DisplayName": name, "Type": "music", "URI": f"{uri}/{name}"}
+            for name in names[uri][offset : offset + limit]
+        ]
+        return Future.fromvalue([objs, offset + limit < len(names[uri])])
+
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue(servers.values())
+        m.server.side_effect = lambda uri: Future.fromvalue(servers[uri])
+        m.search.side_effect = search
+        result = backend.library.search({"any": ["foo"]})
+        assert [track.name for track in result.tracks] == ["f", "E", "d", "d"]
+
+
+def test_search_local_match(backend, server, result):
+    server = dict(server, SearchCaps=["Artist"])
+    tracks = [dict(obj, TrackNumber=n) for n, obj in enumerate(result[1:], 1)]
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue([server])
+        m.server.return_value = Future.fromvalue(server)
+        m.search.return_value = Future.fromvalue([tracks, False])
+        result = backend.library.search(
+            {"artist": ["foo"], "track_no": ["2"]}, exact=True
+        )
+        assert m.search.call_args[0][1] == '(Artist = "foo")'
+        assert result == models.SearchResult(
+            tracks=[models.Track(name="Track #2", uri="dleyna://media/12", track_no=2)]
+        )
+
+
+def test_search_page(config, backend, server):
+    config["dleyna"]["search_order"] = ["DisplayName"]
+    backend.library = library.dLeynaLibraryProvider(backend, config)
+    servers = {
+        uri: dict(server, URI=uri, SortCaps=["*"])
+        for uri in ["dleyna://a", "dleyna://b"]
+    }
+    names = {"dleyna://a": "ACE", "dleyna://b": "BDF"}
+
+    def search(uri, query, offset, limit, filter, order):
+        objs = [
+            {"DisplayName": name, "Type": "music", "URI": f"{uri}/{name}"}
+            for name in names[uri][offset : offset + limit]
+        ]
+        return Future.fromvalue([objs, offset + limit < len(names[uri])])
+
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue(servers.values())
+        m.server.side_effect = lambda uri: Future.fromvalue(servers[uri])
+        m.search.side_effect = search
+        pages = []
+        result, cursor = backend.library.search_page({"any": ["foo"]}, limit=2)
+        pages.append([track.name for track in result.tracks])
+        while cursor:
+            result, cursor = backend.library.search_page(limit=2, cursor=cursor)
+            pages.append([track.name for track in result.tracks])
+        assert pages == [["A", "B"], ["C", "D"], ["E", "F"]]
+
+
+def test_search_page_unsorted(config, backend, server):
+    config["dleyna"]["search_order"] = ["DisplayName"]
+    config["dleyna"]["upnp_search_limit"] = 2
+    backend.library = library.dLeynaLibraryProvider(backend, config)
+    servers = {
+        uri: dict(server, URI=uri, SortCaps=[]) for uri in ["dleyna://a", "dleyna://b"]
+    }
+    names = {"dleyna://a": ["z1", "a1", "d1", "b1"], "dleyna://b": ["y2", "d2", "c2"]}
+    failures = {"dleyna://b": 1}
+
+    def search(uri, query, offset, limit, filter, order):
+        if failures.get(uri) == search.calls:
+            return Future.exception(ValueError("Media server unavailable"))
+        objs = [
+            {"DisplayName": name, "Type": "music", "URI": f"{uri}/{name}"}
+            for name in names[uri][offset : offset + limit]
+        ]
+        return Future.fromvalue([objs, offset + limit < len(names[uri])])
+
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue(servers.values())
+        m.server.side_effect = lambda uri: Future.fromvalue(servers[uri])
+        m.search.side_effect = search
+        pages = []
+        search.calls = 0
+        result, cursor = backend.library.search_page({"any": ["foo"]}, limit=3)
+        pages.append([track.name for track in result.tracks])
+        while cursor:
+            search.calls += 1
+            result, cursor = backend.library.search_page(limit=3, cursor=cursor)
+            pages.append([track.name for track in result.tracks])
+        # failed media server is retried with the next page
+        assert pages == [
+            ["a1", "b1", "c2"],
+            ["d1", "z1"],
+            ["d2", "y2"],
+        ]
+
+
+def test_search_local_match_max_results(config, backend, server):
+    config["dleyna"]["search_max_results"] = 2
+    config["dleyna"]["upnp_search_limit"] = 10
+    backend.library = library.dLeynaLibraryProvider(backend, config)
+    server = dict(server, SearchCaps=["DisplayName", "Type"])
+    objs = [
+        {
+            "DisplayName": f"Track #{n}",
+            "TrackNumber": n % 10,
+            "Type": "music",
+            "URI": f"dleyna://media/{n}",
+        }
+        for n in range(50)
+    ]
+
+    def search(uri, query, offset, limit, *args):
+        return Future.fromvalue(
+            [objs[offset : offset + limit], offset + limit < len(objs)]
+        )
+
+    with mock.patch.object(backend, "client") as m:
+        m.servers.return_value = Future.fromvalue([server])
+        m.server.return_value = Future.fromvalue(server)
+        m.search.side_effect = search
+        result = backend.library.search({"track_name": ["t"], "track_no": ["3"]})
+        # results are counted after matching locally
+        assert [track.uri for track in result.tracks] == [
+            "dleyna://media/3",
+            "dleyna://media/13",
+        ]
+
+
+def test_search_cursor():
+    cursor = library.encode_cursor(None, True, {"dleyna://media": 10})
+    assert library.decode_cursor(cursor) == ({}, True, {"dleyna://media": 10})
+    invalid = [
+        "",
+        "foo",
+        library.encode_cursor("foo", False, {}),
+        library.encode_cursor({}, False, {"dleyna://media": -1}),
+        library.encode_cursor({}, False, {"dleyna://media": "1"}),
+    ]
+    for cursor in invalid:
+        with pytest.raises(ValueError):
+            library.decode_cursor(cursor)
+
+
+def test_search_page_lost_server(backend, server, result):
+    servers = {"dleyna://media": server}
+    cursor = library.encode_cursor(
+        {"any": ["foo"]}, False, {"dleyna://media": 1, "dleyna://lost": 5, "foo": 0}
+    )
+
+    def get_server(uri):
+        if not uri.startswith("dleyna://"):
+            raise ValueError("Invalid URI %s" % uri)
+        try:
+            return Future.fromvalue(servers[uri])
+        except KeyError:
+            raise LookupError("Unknown media server %s" % uri)
+
+    with mock.patch.object(backend, "client") as m:
+        m.server.side_effect = get_server
+        m.search.return_value = Future.fromvalue([result[2:], True])
+        page, cursor = backend.library.search_page(cursor=cursor, limit=1)
+        assert [track.uri for track in page.tracks] == ["dleyna://media/12"]
+        assert library.decode_cursor(cursor)[2] == {"dleyna://media": 2}
+
+
+def test_search_index_urls(config, backend, server, result, tmp_path):
+    config["core"] = {"data_dir": str(tmp_path)}
+    config["dleyna"]["search_index"] = True
+    backend.library = library.dLeynaLibraryProvider(backend, config)
+    server = dict(server, UDN="uuid:media")
+    track = dict(result[1], URLs=["http://old/11.mp3"])
+    db = index.LibraryIndex(tmp_path / "dleyna" / "index.db")
+    db.begin("uuid:media")
+    db.add("uuid:media", [track])
+    db.commit("uuid:media")
+    with mock.patch.object(backend, "client") as m:
+        m.server.return_value = Future.fromvalue(server)
+        result = backend.library.search({"any": ["track"]}, ["dleyna://media"])
+        assert [track.uri for track in result.tracks] == ["dleyna://media/11"]
+        m.search.assert_not_called()
+    # indexed playback URLs may be outdated
+    with pytest.raises(KeyError):
+        backend.urls.get("dleyna://media/11")
@@ -119,6 +119,39 @@ def test_track():
     ) == Track(uri=BASEURI + "/foo", name="Foo", album=Album(name="Bar"))
 
 
+def test_track_properties():
+    track = translator.model(
+        {
+            "DisplayName": "Foo",
+            "Artists": ["Bar"],
+            "URI": BASEURI + "/foo",
+            "Type": "music",
+            "Genre": "Rock",
+            "TrackNumber": 3,
+            "Duration": 180,
+            "Bitrate": 40000,
+        }
+    )
+    assert track == Track(
+        uri=BASEURI + "/foo",
+        name="Foo",
+        artists=[Artist(name="Bar")],
+        genre="Rock",
+        track_no=3,
+        length=180000,
+        bitrate=320,
+    )
+
+
+def test_track_shared_models():
+    obj = {"Artists": ["Foo"], "Album": "Bar", "Type": "music"}
+    first = translator.model(dict(obj, DisplayName="One", URI=BASEURI + "/1"))
+    second = translator.model(dict(obj, DisplayName="Two", URI=BASEURI + "/2"))
+    assert first.album is second.album
+    assert next(iter(first.artists)) is next(iter(second.artists))
+    assert first.artists is second.artists
+
+
 def test_audio_book():
     assert translator.model(
         {
@@ -146,3 +179,42 @@ def test_video():
         translator.model(
             {"DisplayName": "Foo", "URI": BASEURI + "/foo", "Type": "video"}
         )
+
+
+def test_plan():
+    caps = ["Album", "Artist", "DisplayName", "Genre", "Type"]
+    assert translator.plan({"any": ["foo"]}, False, caps) == (
+        '(Album contains "foo" or Artist contains "foo"'
+        ' or DisplayName contains "foo" or Genre contains "foo")',
+        [],
+    )
+    # match "any" locally if more selective keywords are searchable
+    criteria, local = translator.plan(
+        {"any": ["foo"], "album": ["bar"], "track_no": ["1"]}, True, caps
+    )
+    assert criteria == '(Album = "bar")'
+    assert local == ["track_no", "any"]
+    with pytest.raises(NotImplementedError):
+        translator.plan({"track_no": ["1"]}, False, caps)
+    with pytest.raises(NotImplementedError):
+        translator.plan({"composer": ["foo"]}, False, caps)
+
+
+def test_match():
+    obj = {
+        "DisplayName": "Foo",
+        "Artists": ["Bar", "Baz"],
+        "TrackNumber": 12,
+        "Type": "music",
+        "URI": BASEURI + "/foo",
+    }
+    assert translator.match(obj, {"artist": ["baz"], "track_no": ["12"]}, True)
+    assert translator.match(obj, {"track_name": ["fo"]}, False)
+    assert not translator.match(obj, {"track_name": ["fo"]}, True)
+    assert not translator.match(obj, {"albumartist": ["bar"]}, False)
+    # track numbers and dates are matched exactly, as in search criteria
+    assert translator.match(obj, {"track_no": ["12"]}, False)
+    assert not translator.match(obj, {"track_no": ["1"]}, False)
+    obj = dict(obj, Date="2001-02-03")
+    assert translator.match(obj, {"date": ["2001-02-03"]}, False)
+    assert not translator.match(obj, {"date": ["2001"]}, False)